@@ -0,0 +1,95 @@
+"""
+Warm Agent Pool
+
+Keeps live agents between the turns of a conversation, so follow-up messages
+skip rebuilding the agent (model client, RAG function) and reloading the
+session from agent_sessions. Pooled agents run with Agno's cache_session:
+the session stays in memory and every run still writes it through to Postgres.
+
+Agents are keyed by (savant_id, conversation_id, config version). The config
+version hashes everything the agent was built from, so an edited prompt or
+model setting never reuses a stale agent. An agent is checked out for one turn
+at a time; a concurrent turn in the same conversation builds its own agent.
+At most AGENT_POOL_SIZE idle agents are kept, least recently used evicted
+first, each for AGENT_POOL_IDLE_TTL seconds.
+
+Before reuse, the session's updated_at in agent_sessions is compared with the
+value read when the agent was returned. If anything else wrote the session in
+between (another worker, a hedging fallback run), the agent is rebuilt.
+AGENT_POOL_SIZE=0 disables pooling.
+"""
+
+from agno.agent import Agent
+from agno.db.base import BaseDb
+from cachetools import TTLCache
+from sqlalchemy import select
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", 256))
+AGENT_POOL_IDLE_TTL = float(os.getenv("AGENT_POOL_IDLE_TTL", 600))
+
+PoolKey = Tuple[str, str, str]
+
+
+class PooledAgent:
+    """An idle agent and the session version its cached session matches"""
+
+    def __init__(self, agent: Agent, session_version: Optional[Any]):
+        self.agent = agent
+        self.session_version = session_version
+
+
+def config_version(config: Dict[str, Any]) -> str:
+    """Stable hash of the settings an agent is built from"""
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def session_version(db: BaseDb, session_id: str) -> Optional[Any]:
+    """updated_at of a session in agent_sessions (synchronous, reads one column)"""
+    # Only SQL databases expose their tables; for others the session always looks unchanged
+    get_table = getattr(db, '_get_table', None)
+    table = get_table(table_type="sessions") if get_table else None
+    if table is None:
+        return None
+    with db.Session() as sess:
+        return sess.execute(
+            select(table.c.updated_at).where(table.c.session_id == session_id)
+        ).scalar()
+
+
+class AgentPool:
+    def __init__(self, size: int, idle_ttl: float):
+        self.enabled = size > 0
+        self._agents: TTLCache = TTLCache(maxsize=max(size, 1), ttl=idle_ttl)
+
+    def checkout(self, key: PoolKey) -> Optional[PooledAgent]:
+        """Take an idle agent out of the pool (call from the event loop)"""
+        if not self.enabled:
+            return None
+        return self._agents.pop(key, None)
+
+    def checkin(self, key: PoolKey, pooled: PooledAgent) -> None:
+        """Return an agent after a completed turn"""
+        if self.enabled:
+            self._agents[key] = pooled
+
+    def __len__(self) -> int:
+        self._agents.expire()
+        return len(self._agents)
+
+
+_pool: Optional[AgentPool] = None
+
+
+def get_agent_pool() -> AgentPool:
+    global _pool
+    if _pool is None:
+        _pool = AgentPool(AGENT_POOL_SIZE, AGENT_POOL_IDLE_TTL)
+    return _pool
@@ -0,0 +1,131 @@
+"""
+Deferred User Memories
+
+Extracts user memories after the chat response instead of during the agent
+run. Turns are collected per (user, savant) and extracted together once the
+user has been quiet for MEMORY_DEBOUNCE_SECONDS, after MEMORY_MAX_DELAY_SECONDS
+at the latest, or as soon as MEMORY_BATCH_MAX_TURNS turns are waiting.
+
+Extraction (an LLM call plus Agno memory reads/writes over a synchronous
+database connection) runs on a dedicated thread pool of MEMORY_WORKERS
+threads, so it never blocks the event loop serving chat streams. Conversation
+history is still written by the agent run itself.
+
+Pending turns only live in this process: turns waiting at shutdown are
+flushed, turns lost to a crash are not extracted.
+"""
+
+from agno.db.base import BaseDb
+from agno.memory import MemoryManager
+from agno.models.message import Message
+from agno.models.openai import OpenAIChat
+from app.agents.savant_agent_factory import MODEL_API_BASE_URL
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MEMORY_DEBOUNCE_SECONDS = float(os.getenv("MEMORY_DEBOUNCE_SECONDS", 30))
+MEMORY_MAX_DELAY_SECONDS = float(os.getenv("MEMORY_MAX_DELAY_SECONDS", 120))
+MEMORY_BATCH_MAX_TURNS = int(os.getenv("MEMORY_BATCH_MAX_TURNS", 5))
+MEMORY_WORKERS = int(os.getenv("MEMORY_WORKERS", 2))
+
+
+class PendingTurns:
+    def __init__(self, model_id: str, started_at: float):
+        self.messages: List[str] = []
+        self.model_id = model_id
+        self.started_at = started_at
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class DeferredMemoryWriter:
+    def __init__(self, db: BaseDb):
+        self.db = db
+        self._pending: Dict[Tuple[str, str], PendingTurns] = {}
+        self._executor = ThreadPoolExecutor(max_workers=MEMORY_WORKERS, thread_name_prefix="memory")
+
+    def add_turn(self, user_id: str, agent_id: str, model_id: str, message: str) -> None:
+        """
+        Queue a user message for memory extraction (call from the event loop)
+
+        Args:
+            user_id: User the memories belong to
+            agent_id: Agno agent id of the savant ("savant-<id>")
+            model_id: Model to extract with (the savant's model)
+            message: The user's message for this turn
+        """
+        loop = asyncio.get_running_loop()
+        key = (user_id, agent_id)
+
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = PendingTurns(model_id, loop.time())
+        batch.messages.append(message)
+        batch.model_id = model_id
+
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        remaining = MEMORY_MAX_DELAY_SECONDS - (loop.time() - batch.started_at)
+        if len(batch.messages) >= MEMORY_BATCH_MAX_TURNS or remaining <= 0:
+            self._flush(key)
+        else:
+            batch.timer = loop.call_later(min(MEMORY_DEBOUNCE_SECONDS, remaining), self._flush, key)
+
+    def _flush(self, key: Tuple[str, str]) -> None:
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        user_id, agent_id = key
+        self._executor.submit(self._extract, user_id, agent_id, batch.model_id, batch.messages)
+
+    def _extract(self, user_id: str, agent_id: str, model_id: str, messages: List[str]) -> None:
+        """Runs on the memory thread pool"""
+        try:
+            manager = MemoryManager(
+                model=OpenAIChat(
+                    id=model_id,
+                    api_key=os.getenv("OPENROUTER_API_KEY"),
+                    base_url=MODEL_API_BASE_URL,
+                ),
+                db=self.db
+            )
+            manager.create_user_memories(
+                messages=[Message(role="user", content=message) for message in messages],
+                user_id=user_id,
+                agent_id=agent_id
+            )
+            logger.info(f"[Memories] Extracted memories for user {user_id} from {len(messages)} turn(s)")
+        except Exception as e:
+            logger.error(f"[Memories] Extraction failed for user {user_id}: {str(e)}")
+
+    async def shutdown(self) -> None:
+        """Extract all pending turns and wait for running extractions"""
+        for key in list(self._pending):
+            self._flush(key)
+        await asyncio.to_thread(self._executor.shutdown, True)
+
+
+_writer: Optional[DeferredMemoryWriter] = None
+
+
+def get_deferred_memory_writer(db: BaseDb) -> DeferredMemoryWriter:
+    """Process-wide writer, created with the first agent database it is given"""
+    global _writer
+    if _writer is None:
+        _writer = DeferredMemoryWriter(db)
+    return _writer
+
+
+async def shutdown_deferred_memories() -> None:
+    global _writer
+    if _writer is not None:
+        await _writer.shutdown()
+        _writer = None
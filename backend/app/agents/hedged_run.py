@@ -0,0 +1,149 @@
+"""
+Hedged Agent Runs
+
+Streams an agent run and, if the model has not started answering within the
+savant's time-to-first-token deadline, starts the same turn on a fallback
+model in parallel. Whichever run answers first is streamed; the other is
+cancelled, which also closes its upstream HTTP stream. A primary run that
+fails before the deadline falls over to the fallback model immediately.
+
+Opt-in per savant through model_config:
+
+    "hedging": {
+        "enabled": true,
+        "ttft_deadline_ms": 2500,
+        "fallback_model": "openai/gpt-4.1"
+    }
+"""
+
+from agno.agent import Agent
+from agno.run.agent import RunEvent
+from app.services.chat_metrics import HEDGED_RUNS
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTFT_DEADLINE_MS = 2500
+
+
+def get_hedging_config(model_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Hedging settings of a savant, or None if hedging is off or has no fallback model"""
+    hedging = model_config.get('hedging') or {}
+    if not hedging.get('enabled') or not hedging.get('fallback_model'):
+        return None
+
+    return {
+        'ttft_deadline': float(hedging.get('ttft_deadline_ms', DEFAULT_TTFT_DEADLINE_MS)) / 1000,
+        'fallback_model': hedging['fallback_model'],
+    }
+
+
+def _is_first_output(event) -> bool:
+    """Content, or the model deciding to call a tool, counts as its first token"""
+    if event.event == RunEvent.tool_call_started.value:
+        return True
+    return event.event == RunEvent.run_content.value and bool(getattr(event, 'content', None))
+
+
+async def _first_output(events: AsyncIterator) -> List:
+    """Advance a run until the model starts answering; returns the events so far"""
+    buffered = []
+    async for event in events:
+        if event.event == RunEvent.run_error.value:
+            raise RuntimeError(getattr(event, 'content', None) or "Agent run failed")
+        buffered.append(event)
+        if _is_first_output(event):
+            break
+    return buffered
+
+
+async def _cancel(task: asyncio.Task, events: AsyncIterator) -> None:
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    try:
+        await events.aclose()
+    except Exception as e:
+        logger.warning(f"Error closing cancelled run: {str(e)}")
+
+
+async def hedged_run(
+    primary_agent: Agent,
+    build_fallback: Callable[[], Agent],
+    message: str,
+    ttft_deadline: float,
+    outcome: Optional[Dict[str, str]] = None,
+) -> AsyncIterator:
+    """
+    Stream the events of whichever run answers first
+
+    Args:
+        primary_agent: Agent on the savant's own model
+        build_fallback: Builds the agent on the fallback model (only called
+            when the deadline passes or the primary run fails)
+        message: User message for this turn
+        ttft_deadline: Seconds to wait for the primary model before hedging
+        outcome: Filled with {'winner': 'primary' | 'fallback'} once a run wins
+
+    Yields:
+        Agno run events, like agent.arun(message, stream=True)
+    """
+    primary = primary_agent.arun(message, stream=True)
+    runs = {asyncio.create_task(_first_output(primary)): ('primary', primary)}
+    winner = None
+    failure: Optional[BaseException] = None
+
+    try:
+        done, _ = await asyncio.wait(runs, timeout=ttft_deadline)
+        hedged = not done or next(iter(done)).exception() is not None
+        if hedged:
+            logger.info(f"[Hedging] No output from {primary_agent.model.id} after {ttft_deadline:.2f}s, starting fallback")
+            fallback_agent = build_fallback()
+            fallback = fallback_agent.arun(message, stream=True)
+            runs[asyncio.create_task(_first_output(fallback))] = ('fallback', fallback)
+
+        while runs and winner is None:
+            done, _ = await asyncio.wait(runs, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                role, events = runs.pop(task)
+                error = task.exception()
+                if error is not None:
+                    failure = failure or error
+                    logger.warning(f"[Hedging] {role} run failed: {str(error)}")
+                    await _cancel(task, events)
+                elif winner is None:
+                    winner = (role, task.result(), events)
+                else:
+                    # Answered in the same batch as the winner
+                    await _cancel(task, events)
+
+        # The slower run is no longer needed
+        for task, (_, events) in runs.items():
+            await _cancel(task, events)
+        runs = {}
+
+        if winner is None:
+            if hedged:
+                HEDGED_RUNS.labels(outcome='failed').inc()
+            raise failure
+
+        role, buffered, events = winner
+        if outcome is not None:
+            outcome['winner'] = role
+        if hedged:
+            HEDGED_RUNS.labels(outcome=role).inc()
+            logger.info(f"[Hedging] {role} model answered first")
+
+        try:
+            for event in buffered:
+                yield event
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+
+    finally:
+        # Consumer went away while the runs were still racing
+        for task, (_, events) in runs.items():
+            await _cancel(task, events)
@@ -0,0 +1,247 @@
+"""
+Conversation History Compaction
+
+Keeps the history replayed into each turn within HISTORY_TOKEN_BUDGET tokens
+(tiktoken cl100k_base). The most recent runs that fit the budget are replayed
+as messages, with tool calls and tool outputs stripped; older runs are folded
+into a rolling summary stored on the conversation
+(conversations.history_summary, see 023_conversation_history_summary.sql)
+and added to the system message instead.
+
+The summary is updated after each turn on a background thread pool, so the
+next turn finds it current. If the user sends the next message before the
+update finishes, runs outside the window are left out of that one turn.
+"""
+
+from agno.db.base import BaseDb, SessionType
+from agno.run.base import RunStatus
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from openai import OpenAI
+from supabase import Client
+from typing import Any, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 6000))
+HISTORY_SUMMARY_MAX_WORDS = int(os.getenv("HISTORY_SUMMARY_MAX_WORDS", 250))
+# Model that writes summaries; defaults to the savant's own model
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL")
+HISTORY_SUMMARY_WORKERS = int(os.getenv("HISTORY_SUMMARY_WORKERS", 2))
+
+TOKEN_ENCODING = "cl100k_base"
+
+# Runs Agno leaves out of history (AgentSession.get_messages)
+SKIPPED_RUN_STATUSES = (RunStatus.paused, RunStatus.cancelled, RunStatus.error)
+
+
+class HistoryPlan:
+    """How much history one turn replays, and the summary of everything older"""
+
+    def __init__(self, num_history_runs: int, summary: Optional[str] = None):
+        self.num_history_runs = num_history_runs
+        self.summary = summary
+
+
+def count_tokens(text: str) -> int:
+    return len(tiktoken.get_encoding(TOKEN_ENCODING).encode(text))
+
+
+def replayed_messages(run: Any) -> List[Tuple[str, str]]:
+    """(role, text) of the messages Agno replays from a run, without tool calls and outputs"""
+    messages = []
+    for message in run.messages or []:
+        if getattr(message, 'from_history', False) or message.role not in ('user', 'assistant'):
+            continue
+        text = message.get_content_string()
+        if text and text.strip():
+            messages.append((message.role, text))
+    return messages
+
+
+def history_runs(session: Any) -> List[Any]:
+    """The session's runs that Agno would consider for history, oldest first"""
+    return [
+        run for run in session.runs or []
+        if run.parent_run_id is None and run.status not in SKIPPED_RUN_STATUSES
+    ]
+
+
+def split_history(
+    runs: List[Any],
+    summarized_run_id: Optional[str],
+    budget: int,
+    max_runs: int
+) -> Tuple[List[Any], int]:
+    """
+    Runs to fold into the summary, and the number of recent runs to replay
+
+    Runs up to and including `summarized_run_id` are already in the summary.
+    Recent runs are replayed newest first while they fit the budget.
+    """
+    start = 0
+    if summarized_run_id:
+        for index, run in enumerate(runs):
+            if run.run_id == summarized_run_id:
+                start = index + 1
+                break
+    unsummarized = runs[start:]
+
+    window = 0
+    used = 0
+    for run in reversed(unsummarized):
+        tokens = sum(count_tokens(text) for _, text in replayed_messages(run))
+        if window >= max_runs or used + tokens > budget:
+            break
+        window += 1
+        used += tokens
+
+    return unsummarized[:len(unsummarized) - window], window
+
+
+class HistoryCompactor:
+    def __init__(self, db: BaseDb, supabase: Client, max_runs: int, base_url: str):
+        self.db = db
+        self.supabase = supabase
+        self.max_runs = max_runs
+        self.base_url = base_url
+        self._client: Optional[OpenAI] = None
+        self._executor = ThreadPoolExecutor(max_workers=HISTORY_SUMMARY_WORKERS, thread_name_prefix="history")
+        # Conversations being summarized, and those that got another turn meanwhile
+        self._running: Set[str] = set()
+        self._rerun: Set[str] = set()
+
+    def _load(self, conversation_id: str, session: Optional[Any] = None) -> Tuple[List[Any], Optional[dict]]:
+        if session is None:
+            session = self.db.get_session(session_id=conversation_id, session_type=SessionType.AGENT)
+        runs = history_runs(session) if session else []
+
+        result = self.supabase.table('conversations')\
+            .select('history_summary, history_summary_run_id')\
+            .eq('id', conversation_id)\
+            .limit(1)\
+            .execute()
+
+        return runs, (result.data[0] if result.data else None)
+
+    def _budget(self, summary: Optional[str]) -> int:
+        """Message budget left once the summary is in the prompt"""
+        return max(HISTORY_TOKEN_BUDGET - (count_tokens(summary) if summary else 0), 0)
+
+    def plan(self, conversation_id: str, session: Optional[Any] = None) -> HistoryPlan:
+        """History window for the next turn (synchronous database reads; pass an in-memory session to skip loading it)"""
+        runs, row = self._load(conversation_id, session)
+        summary = row.get('history_summary') if row else None
+
+        to_summarize, window = split_history(
+            runs,
+            row.get('history_summary_run_id') if row else None,
+            self._budget(summary),
+            self.max_runs
+        )
+        if to_summarize:
+            logger.info(f"[History] {len(to_summarize)} run(s) of {conversation_id} not yet summarized, left out of this turn")
+
+        return HistoryPlan(num_history_runs=window, summary=summary)
+
+    def schedule_update(self, conversation_id: str, model_id: str) -> None:
+        """Fold runs that no longer fit the budget into the summary, in the background"""
+        if conversation_id in self._running:
+            self._rerun.add(conversation_id)
+            return
+
+        self._running.add(conversation_id)
+        future = self._executor.submit(self._update, conversation_id, model_id)
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._finished, conversation_id, model_id)
+        )
+
+    def _finished(self, conversation_id: str, model_id: str) -> None:
+        self._running.discard(conversation_id)
+        if conversation_id in self._rerun:
+            self._rerun.discard(conversation_id)
+            self.schedule_update(conversation_id, model_id)
+
+    def _update(self, conversation_id: str, model_id: str) -> None:
+        """Runs on the history thread pool"""
+        try:
+            runs, row = self._load(conversation_id)
+            summary = row.get('history_summary') if row else None
+
+            to_summarize, window = split_history(
+                runs,
+                row.get('history_summary_run_id') if row else None,
+                # Leave room for the summary to grow to its word limit
+                max(self._budget(summary) - HISTORY_SUMMARY_MAX_WORDS * 2, 0),
+                self.max_runs
+            )
+            if not to_summarize:
+                return
+
+            summary = self._summarize(summary, to_summarize, HISTORY_SUMMARY_MODEL or model_id)
+
+            self.supabase.table('conversations').update({
+                'history_summary': summary,
+                'history_summary_run_id': to_summarize[-1].run_id,
+                'history_summary_updated_at': datetime.now(timezone.utc).isoformat()
+            }).eq('id', conversation_id).execute()
+
+            logger.info(f"[History] Folded {len(to_summarize)} run(s) into the summary of {conversation_id}, {window} replayed")
+        except Exception as e:
+            logger.error(f"[History] Summary update failed for {conversation_id}: {str(e)}")
+
+    def _summarize(self, summary: Optional[str], runs: List[Any], model_id: str) -> str:
+        transcript = "\n\n".join(
+            f"{role.upper()}: {text}"
+            for run in runs
+            for role, text in replayed_messages(run)
+        )
+
+        prompt = f"""You maintain the running summary of a conversation between a user and an AI assistant.
+
+CURRENT SUMMARY:
+{summary or "(none yet)"}
+
+NEW EXCHANGES:
+{transcript}
+
+Update the summary to include the new exchanges. Keep facts, names, numbers, decisions, open questions and user preferences; drop pleasantries and wording. Stay under {HISTORY_SUMMARY_MAX_WORDS} words.
+
+Output ONLY the updated summary."""
+
+        if self._client is None:
+            self._client = OpenAI(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=self.base_url)
+
+        response = self._client.chat.completions.create(
+            model=model_id,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.2,
+            max_tokens=HISTORY_SUMMARY_MAX_WORDS * 2
+        )
+        return response.choices[0].message.content.strip()
+
+    async def shutdown(self) -> None:
+        await asyncio.to_thread(self._executor.shutdown, True)
+
+
+_compactor: Optional[HistoryCompactor] = None
+
+
+def get_history_compactor(db: BaseDb, supabase: Client, max_runs: int, base_url: str) -> HistoryCompactor:
+    """Process-wide compactor, created with the first agent database it is given"""
+    global _compactor
+    if _compactor is None:
+        _compactor = HistoryCompactor(db, supabase, max_runs, base_url)
+    return _compactor
+
+
+async def shutdown_history_compaction() -> None:
+    global _compactor
+    if _compactor is not None:
+        await _compactor.shutdown()
+        _compactor = None
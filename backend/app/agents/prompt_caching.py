@@ -0,0 +1,72 @@
+"""
+Prompt Caching Model
+
+OpenAIChat for OpenRouter that marks the static prefix of the system message
+with a cache_control breakpoint, so providers that need explicit breakpoints
+(Anthropic, Google) reuse the cached prefix across a savant's conversations.
+Other providers cache prefixes automatically and get the message unchanged.
+
+The static prefix is everything the factory builds for the savant (account
+prompts, brand voice, savant prompt, tool instructions); per-user memories
+that Agno appends after it are sent uncached.
+"""
+
+from agno.models.message import Message
+from agno.models.metrics import Metrics
+from agno.models.openai import OpenAIChat
+from app.services.chat_metrics import record_prompt_tokens
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+# OpenRouter model prefixes that only cache at explicit cache_control breakpoints
+CACHE_CONTROL_PROVIDERS = ('anthropic/', 'google/')
+
+
+@dataclass
+class PromptCachingOpenAIChat(OpenAIChat):
+    # Text that ends the static part of the system message (the last tool
+    # instructions); the breakpoint goes right after it. If unset or not
+    # found, the whole system message is cached.
+    cache_prefix_end: Optional[str] = None
+
+    @property
+    def uses_cache_control(self) -> bool:
+        return self.id.startswith(CACHE_CONTROL_PROVIDERS)
+
+    def _format_message(self, message: Message, compress_tool_results: bool = False) -> Dict[str, Any]:
+        message_dict = super()._format_message(message, compress_tool_results)
+
+        content = message_dict.get('content')
+        if message.role != 'system' or not self.uses_cache_control or not isinstance(content, str):
+            return message_dict
+
+        split = len(content)
+        if self.cache_prefix_end:
+            position = content.rfind(self.cache_prefix_end)
+            if position != -1:
+                split = position + len(self.cache_prefix_end)
+
+        static, dynamic = content[:split], content[split:]
+        parts = [{'type': 'text', 'text': static, 'cache_control': {'type': 'ephemeral'}}]
+        if dynamic.strip():
+            parts.append({'type': 'text', 'text': dynamic})
+
+        message_dict['content'] = parts
+        return message_dict
+
+    def _get_metrics(self, response_usage) -> Metrics:
+        metrics = super()._get_metrics(response_usage)
+
+        # OpenRouter reports cache writes (Anthropic) next to cached_tokens
+        details = getattr(response_usage, 'prompt_tokens_details', None)
+        cache_write_tokens = getattr(details, 'cache_write_tokens', None) if details else None
+        if cache_write_tokens:
+            metrics.cache_write_tokens = cache_write_tokens
+
+        record_prompt_tokens(
+            self.id,
+            metrics.input_tokens,
+            metrics.cache_read_tokens,
+            metrics.cache_write_tokens
+        )
+        return metrics
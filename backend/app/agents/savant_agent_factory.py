@@ -5,15 +5,30 @@ Dynamically creates Agno Agent instances based on Savant configuration.
 Combines account-level prompts, savant-level prompts, and RAG capabilities.
 Supports multiple AI providers (Anthropic, OpenAI, Google, Mistral, DeepSeek, ByteDance).
 Includes conversation memory and user personalization via Agno's built-in storage.
+
+The system message is laid out for provider prompt caching: the savant's
+static instructions and tool instructions come first, in a deterministic
+order, and per-user content follows (see prompt_caching.py).
+
+Agents of ongoing conversations are kept warm between turns (agent_pool.py);
+acquire_agent/release_agent check them out and back in.
 """
 
 from agno.agent import Agent
-from agno.models.openai import OpenAIChat
 from agno.db.postgres import PostgresDb
+from app.agents.prompt_caching import PromptCachingOpenAIChat
+from app.agents.agent_pool import PooledAgent, config_version, get_agent_pool, session_version
+from app.agents.history_compaction import HistoryPlan, get_history_compactor
+from app.services.chat_metrics import AGENT_POOL_LOOKUPS
 from app.tools.rag_tool import create_rag_function
+from dataclasses import dataclass, field
 from supabase import create_client
 import os
-from typing import Optional
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 # Multi-provider API configuration
 MODEL_API_BASE_URL = "https://openrouter.ai/api/v1"
@@ -21,10 +36,61 @@ MODEL_API_BASE_URL = "https://openrouter.ai/api/v1"
 # Memory configuration
 MEMORY_CONFIG = {
     "add_history_to_context": True,     # Pass conversation history to LLM
-    "num_history_runs": 10,             # Last 10 message exchanges
+    "num_history_runs": 10,             # Last 10 message exchanges (at most, when compacting)
+    "compact_history": True,            # Token-budgeted history + rolling summary (history_compaction.py)
     "enable_user_memories": True,       # Remember user facts across sessions
+    "defer_user_memories": True,        # Extract memories after the response (deferred_memories.py)
 }
 
+# Agno only reads memories into the prompt; the chat route queues extraction
+DEFER_USER_MEMORIES = MEMORY_CONFIG["enable_user_memories"] and MEMORY_CONFIG["defer_user_memories"]
+
+
+@dataclass
+class SavantContext:
+    """Savant configuration loaded from the database, everything an agent is built from"""
+    savant_id: str
+    name: str
+    instructions: Optional[str]
+    model_config: Dict[str, Any] = field(default_factory=dict)
+
+
+def history_options(history: Optional[HistoryPlan]) -> Dict[str, Any]:
+    """Agent history settings for one turn (all of them, so a pooled agent can be reset)"""
+    if history is None:
+        return {
+            "add_history_to_context": MEMORY_CONFIG["add_history_to_context"],
+            "num_history_runs": MEMORY_CONFIG["num_history_runs"],
+            "max_tool_calls_from_history": None,
+            "additional_context": None,
+        }
+
+    # Recent runs that fit the token budget, without tool calls/outputs;
+    # older runs reach the model through the summary
+    return {
+        "add_history_to_context": MEMORY_CONFIG["add_history_to_context"] and history.num_history_runs > 0,
+        "num_history_runs": max(history.num_history_runs, 1),
+        "max_tool_calls_from_history": 0,
+        "additional_context": (
+            "<earlier_conversation_summary>\n"
+            f"{history.summary}\n"
+            "</earlier_conversation_summary>"
+        ) if history.summary else None,
+    }
+
+
+# One engine (connection pool) per database URL, shared by all factories and pooled agents
+_agent_dbs: Dict[str, PostgresDb] = {}
+
+
+def get_agent_db(db_url: str) -> PostgresDb:
+    if db_url not in _agent_dbs:
+        _agent_dbs[db_url] = PostgresDb(
+            db_url=db_url,
+            session_table="agent_sessions"
+        )
+    return _agent_dbs[db_url]
+
 
 class SavantAgentFactory:
     def __init__(self):
@@ -41,10 +107,7 @@ class SavantAgentFactory:
             if db_url.startswith("postgresql://"):
                 db_url = db_url.replace("postgresql://", "postgresql+psycopg://", 1)
 
-            self.agent_db = PostgresDb(
-                db_url=db_url,
-                session_table="agent_sessions"
-            )
+            self.agent_db = get_agent_db(db_url)
         else:
             self.agent_db = None
 
@@ -67,6 +130,130 @@ class SavantAgentFactory:
         Returns:
             Configured Agno Agent instance with memory capabilities
         """
+        context = await self.load_context(savant_id, account_id)
+        history = await self.plan_history(session_id)
+        return self.build_agent(context, session_id=session_id, user_id=user_id, history=history)
+
+    def _history_compactor(self):
+        if not MEMORY_CONFIG["compact_history"] or self.agent_db is None:
+            return None
+        return get_history_compactor(
+            self.agent_db, self.supabase, MEMORY_CONFIG["num_history_runs"], MODEL_API_BASE_URL
+        )
+
+    async def plan_history(self, session_id: Optional[str], session: Optional[Any] = None) -> Optional[HistoryPlan]:
+        """
+        History window and rolling summary for the next turn of a conversation
+
+        Pass the session when it is already in memory (a pooled agent's
+        cached session) to skip reloading it. Returns None (plain last-N-runs
+        history) when compaction is off or the plan cannot be loaded.
+        """
+        compactor = self._history_compactor()
+        if compactor is None or not session_id:
+            return None
+
+        try:
+            return await asyncio.to_thread(compactor.plan, session_id, session)
+        except Exception as e:
+            logger.warning(f"Failed to plan history for {session_id}, using full history: {str(e)}")
+            return None
+
+    def _pool_key(self, context: SavantContext, session_id: str, user_id: Optional[str]) -> Tuple[str, str, str]:
+        version = config_version({
+            "name": context.name,
+            "instructions": context.instructions,
+            "model_config": context.model_config,
+            "user_id": user_id,
+        })
+        return (context.savant_id, session_id, version)
+
+    async def acquire_agent(
+        self,
+        context: SavantContext,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> Tuple[Agent, Optional[HistoryPlan]]:
+        """
+        Agent for the next turn of a conversation, reused from the pool when warm
+
+        A warm agent keeps its session in memory, so neither the agent nor
+        the session is rebuilt. Return it with release_agent once the turn
+        has completed.
+
+        Returns:
+            The agent and the history plan it was configured with
+        """
+        pool = get_agent_pool()
+        if pool.enabled and session_id and self.agent_db is not None:
+            pooled = pool.checkout(self._pool_key(context, session_id, user_id))
+            if pooled is None:
+                AGENT_POOL_LOOKUPS.labels(result='miss').inc()
+            else:
+                try:
+                    current = await asyncio.to_thread(session_version, self.agent_db, session_id)
+                    fresh = current == pooled.session_version and pooled.agent.cached_session is not None
+                except Exception as e:
+                    logger.warning(f"[AgentPool] Could not check session {session_id}: {str(e)}")
+                    fresh = False
+
+                if fresh:
+                    AGENT_POOL_LOOKUPS.labels(result='hit').inc()
+                    agent = pooled.agent
+                    history = await self.plan_history(session_id, agent.cached_session)
+                    for option, value in history_options(history).items():
+                        setattr(agent, option, value)
+                    return agent, history
+
+                AGENT_POOL_LOOKUPS.labels(result='stale').inc()
+                logger.info(f"[AgentPool] Session {session_id} changed since its agent was pooled, rebuilding")
+
+        history = await self.plan_history(session_id)
+        agent = self.build_agent(context, session_id=session_id, user_id=user_id, history=history)
+        return agent, history
+
+    async def release_agent(
+        self,
+        context: SavantContext,
+        agent: Agent,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> None:
+        """
+        Return an agent to the pool after a turn it completed and stored
+
+        Only call this when the agent's own run wrote the session (not after
+        errors, cancellations or a hedging fallback answering for it).
+        """
+        pool = get_agent_pool()
+        if not pool.enabled or not session_id or self.agent_db is None or agent.cached_session is None:
+            return
+
+        try:
+            version = await asyncio.to_thread(session_version, self.agent_db, session_id)
+        except Exception as e:
+            logger.warning(f"[AgentPool] Could not read session {session_id}, not pooling its agent: {str(e)}")
+            return
+
+        pool.checkin(self._pool_key(context, session_id, user_id), PooledAgent(agent, version))
+
+    def compact_history(self, session_id: Optional[str], model_id: str) -> None:
+        """After a turn: fold runs that no longer fit the budget into the summary (background)"""
+        compactor = self._history_compactor()
+        if compactor is not None and session_id:
+            compactor.schedule_update(session_id, model_id)
+
+    async def load_context(self, savant_id: str, account_id: str) -> SavantContext:
+        """
+        Load a savant's configuration and build its instructions
+
+        Args:
+            savant_id: UUID of the Savant
+            account_id: UUID of the Account (for permission checking)
+
+        Returns:
+            SavantContext to build one or more agents from
+        """
         # Fetch savant configuration
         savant_result = self.supabase.table('savants')\
             .select('*')\
@@ -117,6 +304,7 @@ class SavantAgentFactory:
         account_prompts_result = account_prompts_query\
             .order('priority', desc=True)\
             .order('created_at')\
+            .order('id')\
             .execute()
 
         # Build hierarchical instructions
@@ -135,11 +323,42 @@ class SavantAgentFactory:
 
         combined_instructions = "\n\n".join(instructions_parts) if instructions_parts else None
 
+        return SavantContext(
+            savant_id=savant_id,
+            name=savant_data.get('name', 'Savant'),
+            instructions=combined_instructions,
+            model_config=model_config or {}
+        )
+
+    def build_agent(
+        self,
+        context: SavantContext,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        model_name: Optional[str] = None,
+        history: Optional[HistoryPlan] = None
+    ) -> Agent:
+        """
+        Build an agent from a loaded savant context (no database reads)
+
+        Args:
+            context: Savant configuration from load_context
+            session_id: Conversation/session ID for memory continuity
+            user_id: User ID for personalized memories across sessions
+            model_name: Overrides the savant's model (e.g. a hedging fallback)
+            history: Compacted history window from plan_history
+
+        Returns:
+            Configured Agno Agent instance with memory capabilities
+        """
+        savant_id = context.savant_id
+        model_config = context.model_config
+
         # Create RAG function with bound savant_id
         rag_function = create_rag_function(savant_id)
 
         # Default to Claude Sonnet 4.5
-        model_name = model_config.get('model', 'anthropic/claude-sonnet-4.5')
+        model_name = model_name or model_config.get('model', 'anthropic/claude-sonnet-4.5')
         temperature = model_config.get('temperature', 0.7)
 
         # Get API key for model routing
@@ -148,24 +367,28 @@ class SavantAgentFactory:
         # Create agent with multi-provider configuration and memory
         agent = Agent(
             id=f"savant-{savant_id}",
-            name=savant_data.get('name', 'Savant'),
-            model=OpenAIChat(
+            name=context.name,
+            model=PromptCachingOpenAIChat(
                 id=model_name,
                 api_key=api_key,
                 base_url=MODEL_API_BASE_URL,
                 temperature=temperature,
                 max_tokens=model_config.get('max_tokens', 4096),
+                # Cache breakpoint after the RAG instructions, before user memories
+                cache_prefix_end=rag_function.instructions,
             ),
-            instructions=combined_instructions,
+            instructions=context.instructions,
             tools=[rag_function],
             markdown=True,
             # Memory configuration for conversation continuity
             db=self.agent_db,
             session_id=session_id,
             user_id=user_id,
-            add_history_to_context=MEMORY_CONFIG["add_history_to_context"],
-            num_history_runs=MEMORY_CONFIG["num_history_runs"],
-            enable_user_memories=MEMORY_CONFIG["enable_user_memories"],
+            # Keep the session in memory between turns when the agent is pooled
+            cache_session=True,
+            **history_options(history),
+            enable_user_memories=MEMORY_CONFIG["enable_user_memories"] and not DEFER_USER_MEMORIES,
+            add_memories_to_context=MEMORY_CONFIG["enable_user_memories"],
         )
 
         return agent
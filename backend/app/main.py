@@ -4,8 +4,9 @@ Main entry point for the chat API
 """
 
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -30,11 +31,25 @@ app.add_middleware(
 # Import custom routes
 from app.routes import chat
 from app.routes import brand_voice
+from app.agents.deferred_memories import shutdown_deferred_memories
+from app.agents.history_compaction import shutdown_history_compaction
+from app.services.stream_buffer import shutdown_stream_buffers
 
 # Include custom routes
 app.include_router(chat.router, prefix="/api", tags=["chat"])
 app.include_router(brand_voice.router, prefix="/api", tags=["brand-voice"])
 
+
+@app.on_event("shutdown")
+async def close_clients():
+    """Close shared HTTP connection pools and flush background work"""
+    await brand_voice.close_openrouter_client()
+    # Runs still streaming save their partial responses
+    await shutdown_stream_buffers()
+    await shutdown_deferred_memories()
+    await shutdown_history_compaction()
+
+
 # Custom health check endpoint
 @app.get("/health")
 async def health():
@@ -45,6 +60,11 @@ async def health():
         "version": "1.0.0"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics (prompt cache usage, ...)"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -3,17 +3,90 @@ Brand Voice Generation API
 
 Generates brand voice system prompts from personality traits using AI.
 Supports both simple (traits only) and advanced (full brand context) modes.
+
+All OpenRouter calls share one AsyncOpenAI client with a pooled httpx
+connection pool, so generation never blocks the event loop (and the chat
+streams running on it).
+
+/generate-brand-voice/batch generates many prompts in one request: identical
+payloads are generated once and results stream back as NDJSON as they finish.
+
+Website analyses are cached in memory per normalized URL, and concurrent
+analyses of the same URL share a single Firecrawl call.
 """
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+from urllib.parse import urlsplit, urlunsplit
+from cachetools import TTLCache
 import os
+import json
+import asyncio
+import hashlib
 import httpx
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 router = APIRouter()
 
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+BRAND_VOICE_MODEL = "anthropic/claude-haiku-4.5"
+
+# Connection pool shared by all brand voice requests
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", 20))
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", 60))
+
+_openrouter_client: Optional[AsyncOpenAI] = None
+
+# Concurrent generations per batch request, and payloads accepted per batch
+BRAND_VOICE_BATCH_CONCURRENCY = int(os.getenv("BRAND_VOICE_BATCH_CONCURRENCY", 8))
+BRAND_VOICE_BATCH_MAX_SIZE = int(os.getenv("BRAND_VOICE_BATCH_MAX_SIZE", 500))
+
+# Successful website analyses, keyed by normalized URL
+WEBSITE_ANALYSIS_CACHE_TTL = int(os.getenv("WEBSITE_ANALYSIS_CACHE_TTL", 3600))
+WEBSITE_ANALYSIS_CACHE_SIZE = int(os.getenv("WEBSITE_ANALYSIS_CACHE_SIZE", 256))
+
+_website_analysis_cache: TTLCache = TTLCache(
+    maxsize=WEBSITE_ANALYSIS_CACHE_SIZE,
+    ttl=WEBSITE_ANALYSIS_CACHE_TTL
+)
+# Analyses in progress, so concurrent requests for a URL share one Firecrawl call
+_website_analysis_inflight: Dict[str, asyncio.Task] = {}
+
+
+def get_openrouter_client() -> Optional[AsyncOpenAI]:
+    """Shared AsyncOpenAI client for OpenRouter, or None if OPENROUTER_API_KEY is not set"""
+    global _openrouter_client
+
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        return None
+
+    if _openrouter_client is None:
+        _openrouter_client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=OPENROUTER_BASE_URL,
+            http_client=httpx.AsyncClient(
+                timeout=httpx.Timeout(OPENROUTER_TIMEOUT, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=OPENROUTER_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENROUTER_MAX_CONNECTIONS
+                )
+            )
+        )
+
+    return _openrouter_client
+
+
+async def close_openrouter_client() -> None:
+    """Close the shared client's connection pool (app shutdown)"""
+    global _openrouter_client
+
+    if _openrouter_client is not None:
+        await _openrouter_client.close()
+        _openrouter_client = None
+
 TRAIT_DESCRIPTIONS = {
     'cheerful': 'maintains an upbeat, positive, and enthusiastic tone',
     'agreeable': 'is accommodating, supportive, and validates user perspectives',
@@ -87,6 +160,10 @@ class GenerateBrandVoiceRequest(BaseModel):
     advanced_data: Optional[AdvancedData] = None
 
 
+class GenerateBrandVoiceBatchRequest(BaseModel):
+    requests: List[GenerateBrandVoiceRequest]
+
+
 class AnalyzeWebsiteRequest(BaseModel):
     url: str
 
@@ -96,17 +173,12 @@ async def extract_business_info(content: str) -> dict:
     if not content or len(content.strip()) < 50:
         return {}
 
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
+    client = get_openrouter_client()
+    if client is None:
         print("[extract_business_info] No API key, skipping extraction")
         return {}
 
     try:
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://openrouter.ai/api/v1"
-        )
-
         extraction_prompt = f"""Analyze this website content and extract business information. Return ONLY valid JSON with these fields (use null for unknown):
 
 {{
@@ -123,8 +195,8 @@ Website content:
 
 Return ONLY the JSON object, no other text."""
 
-        response = client.chat.completions.create(
-            model="anthropic/claude-haiku-4.5",
+        response = await client.chat.completions.create(
+            model=BRAND_VOICE_MODEL,
             messages=[{"role": "user", "content": extraction_prompt}],
             temperature=0.3,
             max_tokens=500
@@ -133,7 +205,6 @@ Return ONLY the JSON object, no other text."""
         result_text = response.choices[0].message.content.strip()
 
         # Try to parse JSON from response
-        import json
         # Handle potential markdown code blocks
         if result_text.startswith("```"):
             result_text = result_text.split("```")[1]
@@ -150,18 +221,41 @@ Return ONLY the JSON object, no other text."""
         return {}
 
 
-@router.post("/analyze-website")
-async def analyze_website(request: AnalyzeWebsiteRequest):
+def normalize_url(url: str) -> str:
     """
-    Analyze website content using Firecrawl API
+    Cache key for a website URL: scheme defaults to https, scheme and host
+    are lowercased, default ports, fragments and trailing slashes dropped.
+    A URL that cannot be parsed (bad port or host) is its own key, and is
+    left for Firecrawl to reject.
     """
-    print(f"[analyze-website] Analyzing URL: {request.url}")
+    url = url.strip()
+    if "://" not in url:
+        url = f"https://{url}"
+
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if port and (scheme, port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{port}"
+    path = parts.path.rstrip("/")
+
+    return urlunsplit((scheme, host, path, parts.query, ""))
 
-    firecrawl_key = os.getenv("FIRECRAWL_API_KEY")
-    if not firecrawl_key:
-        print("[analyze-website] WARNING: FIRECRAWL_API_KEY not set")
-        raise HTTPException(status_code=500, detail="Website analysis not configured")
 
+def is_cacheable_analysis(result: dict) -> bool:
+    """Only complete successes are cached; errors and failed extractions are retried"""
+    if not result.get("success"):
+        return False
+    # Content without extracted fields means the LLM step failed
+    return bool(result.get("extracted")) or not result.get("content")
+
+
+async def fetch_website_analysis(url: str, firecrawl_key: str) -> dict:
+    """Scrape a website with Firecrawl and extract business information from it"""
     try:
         async with httpx.AsyncClient(timeout=60.0) as client:
             response = await client.post(
@@ -171,7 +265,7 @@ async def analyze_website(request: AnalyzeWebsiteRequest):
                     "Content-Type": "application/json"
                 },
                 json={
-                    "url": request.url,
+                    "url": url,
                     "formats": ["markdown"],
                     "onlyMainContent": True,
                     "timeout": 30000
@@ -230,6 +324,46 @@ async def analyze_website(request: AnalyzeWebsiteRequest):
         }
 
 
+@router.post("/analyze-website")
+async def analyze_website(request: AnalyzeWebsiteRequest):
+    """
+    Analyze website content using Firecrawl API
+
+    Results are cached per normalized URL for WEBSITE_ANALYSIS_CACHE_TTL
+    seconds; concurrent requests for the same URL wait on one analysis.
+    """
+    print(f"[analyze-website] Analyzing URL: {request.url}")
+
+    firecrawl_key = os.getenv("FIRECRAWL_API_KEY")
+    if not firecrawl_key:
+        print("[analyze-website] WARNING: FIRECRAWL_API_KEY not set")
+        raise HTTPException(status_code=500, detail="Website analysis not configured")
+
+    cache_key = normalize_url(request.url)
+
+    cached = _website_analysis_cache.get(cache_key)
+    if cached is not None:
+        print(f"[analyze-website] Cache hit for {cache_key}")
+        return cached
+
+    task = _website_analysis_inflight.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(fetch_website_analysis(request.url, firecrawl_key))
+        _website_analysis_inflight[cache_key] = task
+
+        def finish(done: asyncio.Task):
+            _website_analysis_inflight.pop(cache_key, None)
+            if not done.cancelled() and done.exception() is None and is_cacheable_analysis(done.result()):
+                _website_analysis_cache[cache_key] = done.result()
+
+        task.add_done_callback(finish)
+    else:
+        print(f"[analyze-website] Joining in-flight analysis of {cache_key}")
+
+    # Shielded: a disconnecting client must not cancel the analysis others are waiting on
+    return await asyncio.shield(task)
+
+
 def build_advanced_prompt_context(advanced_data: AdvancedData) -> str:
     """Build context string from advanced brand data"""
     sections = []
@@ -291,53 +425,26 @@ def build_advanced_prompt_context(advanced_data: AdvancedData) -> str:
     return "\n\n".join(sections)
 
 
-@router.post("/generate-brand-voice")
-async def generate_brand_voice(request: GenerateBrandVoiceRequest):
-    """
-    Generate a brand voice system prompt from selected personality traits
-    and optional advanced brand context
-    """
-    print(f"[generate-brand-voice] Received request with traits: {request.traits}")
-    print(f"[generate-brand-voice] Has advanced data: {request.advanced_data is not None}")
-
-    # Build trait descriptions
-    trait_texts = []
-    for trait in request.traits:
-        if trait in TRAIT_DESCRIPTIONS:
-            trait_texts.append(TRAIT_DESCRIPTIONS[trait])
-
-    print(f"[generate-brand-voice] Matched trait descriptions: {trait_texts}")
-
-    if not trait_texts:
-        print("[generate-brand-voice] No valid traits found, returning empty prompt")
-        return {"prompt": ""}
-
-    # Check API key
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    print(f"[generate-brand-voice] OPENROUTER_API_KEY set: {bool(api_key)}")
+def build_trait_texts(traits: List[str]) -> List[str]:
+    """Descriptions of the known traits, in request order"""
+    return [TRAIT_DESCRIPTIONS[trait] for trait in traits if trait in TRAIT_DESCRIPTIONS]
 
-    if not api_key:
-        print("[generate-brand-voice] ERROR: OPENROUTER_API_KEY not set!")
-        raise HTTPException(status_code=500, detail="OPENROUTER_API_KEY not configured")
 
-    try:
-        # Use AI to generate cohesive brand voice prompt
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://openrouter.ai/api/v1"
-        )
+def build_generation_prompt(trait_texts: List[str], advanced_data: Optional[AdvancedData]) -> str:
+    """Prompt asking the model for a brand voice system prompt"""
+    trait_lines = chr(10).join(f'- {text}' for text in trait_texts)
 
-        # Build context from advanced data if present
-        advanced_context = ""
-        if request.advanced_data:
-            advanced_context = build_advanced_prompt_context(request.advanced_data)
+    # Build context from advanced data if present
+    advanced_context = ""
+    if advanced_data:
+        advanced_context = build_advanced_prompt_context(advanced_data)
 
-        if advanced_context:
-            # Advanced mode: use all the brand context
-            generation_prompt = f"""Create a comprehensive brand voice system prompt (3-4 paragraphs) for an AI assistant based on the following brand information:
+    if advanced_context:
+        # Advanced mode: use all the brand context
+        return f"""Create a comprehensive brand voice system prompt (3-4 paragraphs) for an AI assistant based on the following brand information:
 
 PERSONALITY TRAITS:
-{chr(10).join(f'- {text}' for text in trait_texts)}
+{trait_lines}
 
 {advanced_context}
 
@@ -350,11 +457,11 @@ The brand voice prompt should:
 6. Respect any messaging restrictions mentioned
 
 Output ONLY the system prompt text, no explanations or meta-commentary."""
-        else:
-            # Simple mode: just traits
-            generation_prompt = f"""Create a concise system prompt instruction (2-3 paragraphs) that defines a brand voice with these characteristics:
 
-{chr(10).join(f'- {text}' for text in trait_texts)}
+    # Simple mode: just traits
+    return f"""Create a concise system prompt instruction (2-3 paragraphs) that defines a brand voice with these characteristics:
+
+{trait_lines}
 
 The prompt should:
 1. Be written as instructions for an AI assistant
@@ -364,19 +471,62 @@ The prompt should:
 
 Output ONLY the system prompt text, no explanations or meta-commentary."""
 
-        print(f"[generate-brand-voice] Calling OpenRouter API...")
 
+def build_generation_request(request: GenerateBrandVoiceRequest, trait_texts: List[str]) -> Dict[str, Any]:
+    """Chat completion arguments for a brand voice generation"""
+    return {
+        "model": BRAND_VOICE_MODEL,
+        "messages": [{"role": "user", "content": build_generation_prompt(trait_texts, request.advanced_data)}],
+        "temperature": 0.7,
         # Use more tokens for advanced mode
-        max_tokens = 800 if request.advanced_data else 500
+        "max_tokens": 800 if request.advanced_data else 500,
+    }
 
-        response = client.chat.completions.create(
-            model="anthropic/claude-haiku-4.5",
-            messages=[{"role": "user", "content": generation_prompt}],
-            temperature=0.7,
-            max_tokens=max_tokens
-        )
 
-        generated_prompt = response.choices[0].message.content.strip()
+def require_openrouter_client(log_prefix: str) -> AsyncOpenAI:
+    client = get_openrouter_client()
+    print(f"[{log_prefix}] OPENROUTER_API_KEY set: {client is not None}")
+
+    if client is None:
+        print(f"[{log_prefix}] ERROR: OPENROUTER_API_KEY not set!")
+        raise HTTPException(status_code=500, detail="OPENROUTER_API_KEY not configured")
+
+    return client
+
+
+async def generate_prompt(client: AsyncOpenAI, request: GenerateBrandVoiceRequest, trait_texts: List[str]) -> str:
+    response = await client.chat.completions.create(**build_generation_request(request, trait_texts))
+    return response.choices[0].message.content.strip()
+
+
+def brand_voice_request_key(request: GenerateBrandVoiceRequest) -> str:
+    """Content hash of a generation payload (identical payloads share one generation)"""
+    payload = json.dumps(request.model_dump(exclude_none=True), sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+@router.post("/generate-brand-voice")
+async def generate_brand_voice(request: GenerateBrandVoiceRequest):
+    """
+    Generate a brand voice system prompt from selected personality traits
+    and optional advanced brand context
+    """
+    print(f"[generate-brand-voice] Received request with traits: {request.traits}")
+    print(f"[generate-brand-voice] Has advanced data: {request.advanced_data is not None}")
+
+    trait_texts = build_trait_texts(request.traits)
+    print(f"[generate-brand-voice] Matched trait descriptions: {trait_texts}")
+
+    if not trait_texts:
+        print("[generate-brand-voice] No valid traits found, returning empty prompt")
+        return {"prompt": ""}
+
+    client = require_openrouter_client("generate-brand-voice")
+
+    try:
+        print(f"[generate-brand-voice] Calling OpenRouter API...")
+
+        generated_prompt = await generate_prompt(client, request, trait_texts)
         print(f"[generate-brand-voice] Success! Generated prompt length: {len(generated_prompt)}")
 
         return {"prompt": generated_prompt}
@@ -384,3 +534,144 @@ Output ONLY the system prompt text, no explanations or meta-commentary."""
     except Exception as e:
         print(f"[generate-brand-voice] ERROR: {type(e).__name__}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate: {str(e)}")
+
+
+@router.post("/generate-brand-voice/stream")
+async def generate_brand_voice_stream(request: GenerateBrandVoiceRequest):
+    """
+    Streaming variant of /generate-brand-voice (Server-Sent Events)
+
+    Events: start, content (prompt text as it is generated), done (full
+    prompt) and error - the same frames as /chat.
+    """
+    print(f"[generate-brand-voice/stream] Received request with traits: {request.traits}")
+
+    trait_texts = build_trait_texts(request.traits)
+    client = require_openrouter_client("generate-brand-voice/stream") if trait_texts else None
+
+    async def generate():
+        full_prompt = ""
+        stream = None
+
+        try:
+            yield f"data: {json.dumps({'type': 'start'})}\n\n"
+
+            if client is None:
+                print("[generate-brand-voice/stream] No valid traits found, returning empty prompt")
+                yield f"data: {json.dumps({'type': 'done', 'prompt': ''})}\n\n"
+                return
+
+            stream = await client.chat.completions.create(
+                **build_generation_request(request, trait_texts),
+                stream=True
+            )
+
+            async for chunk in stream:
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    full_prompt += content
+                    yield f"data: {json.dumps({'type': 'content', 'content': content})}\n\n"
+
+            full_prompt = full_prompt.strip()
+            print(f"[generate-brand-voice/stream] Success! Generated prompt length: {len(full_prompt)}")
+            yield f"data: {json.dumps({'type': 'done', 'prompt': full_prompt})}\n\n"
+
+        except Exception as e:
+            print(f"[generate-brand-voice/stream] ERROR: {type(e).__name__}: {str(e)}")
+            yield f"data: {json.dumps({'type': 'error', 'error': f'Failed to generate: {str(e)}'})}\n\n"
+
+        finally:
+            # Returns the connection to the pool if the client disconnected mid-stream
+            if stream is not None:
+                await stream.close()
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",  # Disable nginx buffering
+        }
+    )
+
+
+@router.post("/generate-brand-voice/batch")
+async def generate_brand_voice_batch(batch: GenerateBrandVoiceBatchRequest):
+    """
+    Generate brand voice prompts for many payloads (NDJSON stream)
+
+    Identical payloads (same traits and advanced data) are generated once.
+    Up to BRAND_VOICE_BATCH_CONCURRENCY generations run at a time, and one
+    line is written per payload as soon as its generation completes:
+
+        {"type": "result", "index": 3, "prompt": "..."}
+        {"type": "result", "index": 4, "error": "Failed to generate: ..."}
+        {"type": "done", "total": 5, "generated": 4, "failed": 1}
+
+    `index` is the payload's position in `requests`.
+    """
+    if len(batch.requests) > BRAND_VOICE_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large ({len(batch.requests)} requests, max {BRAND_VOICE_BATCH_MAX_SIZE})"
+        )
+
+    # content hash -> positions of the payloads sharing it
+    groups: Dict[str, List[int]] = {}
+    for index, request in enumerate(batch.requests):
+        groups.setdefault(brand_voice_request_key(request), []).append(index)
+
+    print(f"[generate-brand-voice/batch] {len(batch.requests)} requests, {len(groups)} unique")
+
+    needs_model = any(build_trait_texts(request.traits) for request in batch.requests)
+    client = require_openrouter_client("generate-brand-voice/batch") if needs_model else None
+
+    async def run(indexes: List[int], semaphore: asyncio.Semaphore) -> tuple:
+        request = batch.requests[indexes[0]]
+        trait_texts = build_trait_texts(request.traits)
+        if not trait_texts:
+            return indexes, "", None
+
+        async with semaphore:
+            try:
+                return indexes, await generate_prompt(client, request, trait_texts), None
+            except Exception as e:
+                print(f"[generate-brand-voice/batch] ERROR: {type(e).__name__}: {str(e)}")
+                return indexes, None, f"Failed to generate: {str(e)}"
+
+    async def generate():
+        semaphore = asyncio.Semaphore(BRAND_VOICE_BATCH_CONCURRENCY)
+        tasks = [asyncio.create_task(run(indexes, semaphore)) for indexes in groups.values()]
+        generated = failed = 0
+
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                indexes, prompt, error = await next_result
+                # Counts are per payload, like `total`
+                if error is None:
+                    generated += len(indexes)
+                else:
+                    failed += len(indexes)
+
+                for index in indexes:
+                    line = {'type': 'result', 'index': index}
+                    line.update({'prompt': prompt} if error is None else {'error': error})
+                    yield json.dumps(line) + "\n"
+
+            print(f"[generate-brand-voice/batch] Complete: {generated} generated, {failed} failed")
+            yield json.dumps({'type': 'done', 'total': len(batch.requests), 'generated': generated, 'failed': failed}) + "\n"
+
+        finally:
+            # Client disconnected: stop generations that have not finished
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Disable nginx buffering
+        }
+    )
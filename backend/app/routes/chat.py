@@ -6,24 +6,61 @@ Uses Server-Sent Events (SSE) for real-time streaming.
 Supports conversation memory and user personalization via Agno.
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
-from app.agents.savant_agent_factory import SavantAgentFactory
+from app.agents.savant_agent_factory import SavantAgentFactory, DEFER_USER_MEMORIES
+from app.agents.deferred_memories import get_deferred_memory_writer
+from app.agents.hedged_run import get_hedging_config, hedged_run
+from app.services.admission import AdmissionLease, AdmissionRejected, get_admission_controller
+from app.services.chat_metrics import TTFT_SECONDS
+from app.services.client_disconnect import ClientDisconnected, until_disconnected
+from app.services.stream_buffer import StreamBuffer, StreamGone, format_frame, get_stream_buffers, parse_event_id
 from supabase import create_client
 import os
-import json
 import asyncio
 import logging
+import math
 import traceback
 import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
 
 router = APIRouter()
 
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # Disable nginx buffering
+}
+
+
+async def stream_frames(buffer: StreamBuffer, http_request: Request, after: int = 0):
+    """Send a buffered chat response over SSE, from frame `after` until the run finishes"""
+    stream_buffers = get_stream_buffers()
+    stream_buffers.attach(buffer)
+    live_from = buffer.last_seq
+    frames = until_disconnected(buffer.tail(after), http_request)
+    try:
+        async for seq, payload in frames:
+            yield format_frame(buffer.message_id, seq, payload)
+
+            # Small delay to prevent overwhelming the client (replayed frames go out at once)
+            if payload['type'] == 'content' and seq > live_from:
+                await asyncio.sleep(0.01)
+    except ClientDisconnected:
+        pass
+    except StreamGone as e:
+        # This client fell further behind than the buffer holds
+        logger.warning(f"[Chat] Dropping slow client of {buffer.conversation_id}: {str(e)}")
+    finally:
+        # Starts the grace period for a reconnect if this was the last client
+        stream_buffers.detach(buffer)
+        await frames.aclose()
+
 
 class ChatRequest(BaseModel):
     savant_id: str
@@ -33,8 +70,34 @@ class ChatRequest(BaseModel):
     user_id: Optional[str] = None          # For user memories across sessions
 
 
+async def admit_chat(request: ChatRequest):
+    """
+    Admission control in front of chat(): waits for a concurrency slot for
+    the account, or answers 429. The slot is released when the run ends, or
+    here if chat() fails before starting it.
+    """
+    try:
+        lease = await get_admission_controller().admit(request.account_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
+    try:
+        yield lease
+    except BaseException:
+        lease.release()
+        raise
+
+
 @router.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(
+    request: ChatRequest,
+    http_request: Request,
+    lease: AdmissionLease = Depends(admit_chat)
+):
     """
     Chat endpoint with streaming SSE response
 
@@ -44,6 +107,14 @@ async def chat(request: ChatRequest):
     3. Create dynamic agent for the savant
     4. Stream AI response via SSE
     5. Save assistant message to database
+
+    Admitted through admit_chat: requests over the account's concurrency
+    limit wait briefly in a fair queue, or get 429.
+
+    Every frame has an SSE id; after a dropped connection, resume with
+    GET /chat/{conversation_id}/stream and Last-Event-ID. If no client is
+    connected for STREAM_RESUME_GRACE_SECONDS, the agent run is cancelled and
+    the partial response is saved with metadata {"truncated": true}.
     """
     supabase = create_client(
         os.getenv("SUPABASE_URL"),
@@ -116,62 +187,114 @@ async def chat(request: ChatRequest):
     # Create agent factory and get agent with memory context
     try:
         factory = SavantAgentFactory()
-        agent = await factory.create_agent(
-            savant_id=request.savant_id,
-            account_id=request.account_id,
+        savant_context = await factory.load_context(request.savant_id, request.account_id)
+        # Warm agent from earlier turns of this conversation, or a new one
+        agent, history = await factory.acquire_agent(
+            savant_context,
             session_id=conversation_id,  # Links conversation for memory
             user_id=request.user_id       # For user personalization
         )
+        hedging = get_hedging_config(savant_context.model_config)
     except Exception as e:
         logger.error(f"Failed to create agent: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Failed to create agent: {str(e)}")
 
-    # Stream response using Server-Sent Events
-    async def generate():
+    def save_assistant_message(content: str, truncated: bool = False):
+        try:
+            supabase.table('messages').insert({
+                'conversation_id': conversation_id,
+                'savant_id': request.savant_id,
+                'account_id': request.account_id,
+                'role': 'assistant',
+                'content': content,
+                'metadata': {'truncated': True} if truncated else {}
+            }).execute()
+        except Exception as e:
+            logger.error(f"Error saving assistant message: {str(e)}")
+            logger.error(traceback.format_exc())
+
+    # The run writes SSE frames into a buffer; connections (this one and any
+    # reconnects, see resume_chat) read from it
+    message_id = str(uuid.uuid4())
+    stream_buffers = get_stream_buffers()
+    buffer = stream_buffers.create(conversation_id, message_id, request.account_id)
+
+    async def run_chat():
         full_response = ""
         error_occurred = False
         start_time = time.time()
         first_chunk_received = False
 
         try:
-            logger.info(f"[TIMING] generate() started for savant {request.savant_id}")
+            logger.info(f"[TIMING] run_chat() started for savant {request.savant_id}")
 
             # Send initial event with conversation_id for frontend tracking
-            yield f"data: {json.dumps({'type': 'start', 'savant': savant_name, 'conversation_id': conversation_id})}\n\n"
-
-            # Run agent with streaming
-            async for chunk in agent.arun(request.message, stream=True):
-                if not first_chunk_received:
-                    logger.info(f"[TIMING] First chunk received at {time.time() - start_time:.2f}s")
-                    first_chunk_received = True
-
-                if chunk.content:
-                    full_response += chunk.content
-
-                    # Send content chunk
-                    yield f"data: {json.dumps({'type': 'content', 'content': chunk.content})}\n\n"
-
-                    # Small delay to prevent overwhelming the client
-                    await asyncio.sleep(0.01)
+            buffer.append({'type': 'start', 'savant': savant_name, 'conversation_id': conversation_id, 'message_id': message_id})
+
+            # Run agent with streaming, racing a fallback model if the savant enables hedging
+            hedge_outcome = {}
+            if hedging:
+                run_stream = hedged_run(
+                    agent,
+                    lambda: factory.build_agent(
+                        savant_context,
+                        session_id=conversation_id,
+                        user_id=request.user_id,
+                        model_name=hedging['fallback_model'],
+                        history=history
+                    ),
+                    request.message,
+                    hedging['ttft_deadline'],
+                    outcome=hedge_outcome
+                )
+            else:
+                run_stream = agent.arun(request.message, stream=True)
+
+            try:
+                async for chunk in run_stream:
+                    if not first_chunk_received:
+                        logger.info(f"[TIMING] First chunk received at {time.time() - start_time:.2f}s")
+                        first_chunk_received = True
+
+                    if chunk.content:
+                        if not full_response:
+                            TTFT_SECONDS.observe(time.time() - start_time)
+
+                        full_response += chunk.content
+
+                        # Send content chunk
+                        buffer.append({'type': 'content', 'content': chunk.content})
+            except asyncio.CancelledError:
+                # Every client left and none came back within the grace period: the run
+                # and its upstream model stream are stopped (not stored in the agent
+                # session, agent not pooled)
+                logger.info(f"[Chat] Run for {conversation_id} cancelled after {time.time() - start_time:.2f}s")
+                if full_response:
+                    save_assistant_message(full_response, truncated=True)
+                raise
+
+            # Keep the agent warm for the next turn, unless the fallback model answered
+            # (its run, not this agent's, wrote the session)
+            if hedge_outcome.get('winner', 'primary') == 'primary':
+                await factory.release_agent(savant_context, agent, conversation_id, request.user_id)
 
             # Save complete assistant message to database
             if full_response:
-                try:
-                    supabase.table('messages').insert({
-                        'conversation_id': conversation_id,
-                        'savant_id': request.savant_id,
-                        'account_id': request.account_id,
-                        'role': 'assistant',
-                        'content': full_response
-                    }).execute()
-                except Exception as e:
-                    logger.error(f"Error saving assistant message: {str(e)}")
-                    logger.error(traceback.format_exc())
+                save_assistant_message(full_response)
+
+                # Summarize turns that no longer fit the history budget
+                factory.compact_history(conversation_id, agent.model.id)
+
+                # Memory extraction runs in the background, off the response path
+                if DEFER_USER_MEMORIES and request.user_id and factory.agent_db is not None:
+                    get_deferred_memory_writer(factory.agent_db).add_turn(
+                        request.user_id, agent.id, agent.model.id, request.message
+                    )
 
             # Send completion event
             logger.info(f"[TIMING] Streaming complete at {time.time() - start_time:.2f}s, response length: {len(full_response)}")
-            yield f"data: {json.dumps({'type': 'done', 'full_response': full_response})}\n\n"
+            buffer.append({'type': 'done', 'full_response': full_response})
 
         except Exception as e:
             error_occurred = True
@@ -180,16 +303,60 @@ async def chat(request: ChatRequest):
             logger.error(traceback.format_exc())
 
             # Send error event
-            yield f"data: {json.dumps({'type': 'error', 'error': error_msg})}\n\n"
+            buffer.append({'type': 'error', 'error': error_msg})
+
+        finally:
+            stream_buffers.finish(buffer)
+            lease.release()
+
+    buffer.task = asyncio.create_task(run_chat())
+
+    return StreamingResponse(
+        stream_frames(buffer, http_request),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@router.get("/chat/{conversation_id}/stream")
+async def resume_chat(
+    conversation_id: str,
+    account_id: str,
+    http_request: Request,
+    message_id: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Reattach to a chat response after the connection dropped
+
+    Replays the frames after Last-Event-ID (or the whole response when only
+    message_id, or nothing, is given: the conversation's latest response)
+    and then tails the run if it is still going. Never starts a new run.
+
+    404 if the response is not buffered (finished too long ago, or running
+    on another worker); 410 if the missed frames were already evicted.
+    """
+    after = 0
+    if last_event_id:
+        try:
+            message_id, after = parse_event_id(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    buffer = get_stream_buffers().get(conversation_id, message_id)
+    if buffer is None or buffer.account_id != account_id:
+        raise HTTPException(status_code=404, detail="No resumable stream for this conversation")
+
+    try:
+        await buffer.frames_after(after)
+    except StreamGone as e:
+        raise HTTPException(status_code=410, detail=str(e))
 
+    logger.info(f"[Chat] Client resumed {conversation_id} after frame {after}")
     return StreamingResponse(
-        generate(),
+        stream_frames(buffer, http_request, after),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",  # Disable nginx buffering
-        }
+        headers=SSE_HEADERS
     )
 
 
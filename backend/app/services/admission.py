@@ -0,0 +1,182 @@
+"""
+Chat Admission Control
+
+Limits concurrent chat runs per worker: at most CHAT_MAX_CONCURRENT_STREAMS
+in total and CHAT_ACCOUNT_MAX_STREAMS per account. A run holds its slot
+until it finishes (see chat.py), including any reconnect grace period.
+
+Requests over the limit wait in a weighted fair queue: each account's
+requests get start tags spaced 1/weight apart in virtual time, and a freed
+slot goes to the waiting request with the lowest tag whose account is under
+its own limit. An account sending a burst therefore queues behind itself,
+while other accounts' requests keep getting served at their share. Weights
+default to 1 and can be set per account with CHAT_ACCOUNT_WEIGHTS (a JSON
+object of account id to weight).
+
+Waiting is bounded: a request is rejected at once if its account already
+has CHAT_ACCOUNT_MAX_QUEUED requests waiting, and after
+CHAT_ADMISSION_MAX_WAIT_SECONDS otherwise. The route answers 429 either way.
+"""
+
+from app.services.chat_metrics import ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+from collections import defaultdict
+from typing import Dict, List, Optional
+import asyncio
+import itertools
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+CHAT_MAX_CONCURRENT_STREAMS = int(os.getenv("CHAT_MAX_CONCURRENT_STREAMS", 100))
+CHAT_ACCOUNT_MAX_STREAMS = int(os.getenv("CHAT_ACCOUNT_MAX_STREAMS", 8))
+CHAT_ACCOUNT_MAX_QUEUED = int(os.getenv("CHAT_ACCOUNT_MAX_QUEUED", 16))
+CHAT_ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("CHAT_ADMISSION_MAX_WAIT_SECONDS", 5))
+CHAT_ACCOUNT_WEIGHTS: Dict[str, float] = json.loads(os.getenv("CHAT_ACCOUNT_WEIGHTS") or "{}")
+
+
+class AdmissionRejected(Exception):
+    """A chat request was not admitted (account queue full, or waited too long)"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Too many concurrent chats ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionLease:
+    """A running chat's slot; release exactly when the run is over (idempotent)"""
+
+    def __init__(self, controller: "AdmissionController", account_id: str):
+        self._controller = controller
+        self.account_id = account_id
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self.account_id)
+
+
+class _Waiter:
+    def __init__(self, account_id: str, tag: float, order: int, future: asyncio.Future):
+        self.account_id = account_id
+        self.tag = tag
+        self.order = order
+        self.future = future
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_streams: int = CHAT_MAX_CONCURRENT_STREAMS,
+        account_max_streams: int = CHAT_ACCOUNT_MAX_STREAMS,
+        account_max_queued: int = CHAT_ACCOUNT_MAX_QUEUED,
+        max_wait: float = CHAT_ADMISSION_MAX_WAIT_SECONDS,
+        weights: Optional[Dict[str, float]] = None
+    ):
+        self.max_streams = max_streams
+        self.account_max_streams = account_max_streams
+        self.account_max_queued = account_max_queued
+        self.max_wait = max_wait
+        self.weights = CHAT_ACCOUNT_WEIGHTS if weights is None else weights
+
+        self._running = 0
+        self._account_running: Dict[str, int] = defaultdict(int)
+        self._waiting: List[_Waiter] = []
+        self._account_waiting: Dict[str, int] = defaultdict(int)
+        self._last_tag: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._order = itertools.count()
+
+    def _has_slot(self, account_id: str) -> bool:
+        return (
+            self._running < self.max_streams
+            and self._account_running[account_id] < self.account_max_streams
+        )
+
+    def _grant(self, account_id: str) -> AdmissionLease:
+        self._running += 1
+        self._account_running[account_id] += 1
+        return AdmissionLease(self, account_id)
+
+    async def admit(self, account_id: str) -> AdmissionLease:
+        """
+        Wait for a slot for one of the account's chat runs (call from the event loop)
+
+        Raises:
+            AdmissionRejected: The account's queue is full, or no slot freed
+                up within max_wait
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        # Every release dispatches free slots to eligible waiters at once, so
+        # waiters still queued are blocked by their own account's limit and a
+        # free slot here is not one any of them could take
+        if self._has_slot(account_id):
+            ADMISSION_WAIT_SECONDS.observe(0)
+            return self._grant(account_id)
+
+        if self._account_waiting[account_id] >= self.account_max_queued:
+            ADMISSION_REJECTED.labels(reason='queue_full').inc()
+            raise AdmissionRejected('queue_full', self.max_wait)
+
+        tag = max(self._virtual_time, self._last_tag.get(account_id, 0.0)) + 1.0 / self.weights.get(account_id, 1.0)
+        self._last_tag[account_id] = tag
+        waiter = _Waiter(account_id, tag, next(self._order), loop.create_future())
+        self._waiting.append(waiter)
+        self._account_waiting[account_id] += 1
+
+        try:
+            lease = await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+        except asyncio.TimeoutError:
+            self._remove(waiter)
+            if waiter.future.done():
+                # Granted while the timeout fired
+                lease = waiter.future.result()
+            else:
+                ADMISSION_REJECTED.labels(reason='timeout').inc()
+                logger.info(f"[Admission] Account {account_id} waited {self.max_wait:.1f}s without a slot, rejecting")
+                raise AdmissionRejected('timeout', self.max_wait)
+        except asyncio.CancelledError:
+            self._remove(waiter)
+            if waiter.future.done():
+                waiter.future.result().release()
+            raise
+
+        ADMISSION_WAIT_SECONDS.observe(loop.time() - started)
+        return lease
+
+    def _remove(self, waiter: _Waiter) -> None:
+        if waiter in self._waiting:
+            self._waiting.remove(waiter)
+            self._account_waiting[waiter.account_id] -= 1
+
+    def _release(self, account_id: str) -> None:
+        self._running -= 1
+        self._account_running[account_id] -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters in start tag order"""
+        for waiter in sorted(self._waiting, key=lambda w: (w.tag, w.order)):
+            if self._running >= self.max_streams:
+                break
+            if not self._has_slot(waiter.account_id):
+                continue
+
+            self._remove(waiter)
+            self._virtual_time = max(self._virtual_time, waiter.tag)
+            waiter.future.set_result(self._grant(waiter.account_id))
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
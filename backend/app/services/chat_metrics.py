@@ -0,0 +1,56 @@
+"""
+Chat Metrics
+
+Prometheus metrics for the chat API, served by the backend at /metrics.
+
+Useful queries:
+- cache hit rate:  sum(rate(savant_chat_prompt_tokens_total{cache="read"}[15m]))
+                   / sum(rate(savant_chat_prompt_tokens_total[15m]))
+- p99 TTFT:        histogram_quantile(0.99, rate(savant_chat_ttft_seconds_bucket[15m]))
+- hedge rate:      sum(rate(savant_chat_hedged_runs_total[15m]))
+- p99 queue wait:  histogram_quantile(0.99, rate(savant_chat_admission_wait_seconds_bucket[15m]))
+- agent pool hits: sum(rate(savant_chat_agent_pool_lookups_total{result="hit"}[15m]))
+                   / sum(rate(savant_chat_agent_pool_lookups_total[15m]))
+"""
+
+from prometheus_client import Counter, Histogram
+
+PROMPT_TOKENS = Counter(
+    'savant_chat_prompt_tokens',
+    'Input tokens sent to the model, by prompt cache outcome (read, write, uncached)',
+    ['model', 'cache']
+)
+TTFT_SECONDS = Histogram(
+    'savant_chat_ttft_seconds',
+    'Time from the start of a chat run to the first streamed content',
+    buckets=(0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 20, 30)
+)
+HEDGED_RUNS = Counter(
+    'savant_chat_hedged_runs',
+    'Runs where a fallback model was started, by which run answered first (primary, fallback, failed)',
+    ['outcome']
+)
+AGENT_POOL_LOOKUPS = Counter(
+    'savant_chat_agent_pool_lookups',
+    'Agent pool lookups for a follow-up turn, by result (hit, miss, stale)',
+    ['result']
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    'savant_chat_admission_wait_seconds',
+    'Time a chat request waited for a concurrency slot (0 when admitted at once)',
+    buckets=(0, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10)
+)
+ADMISSION_REJECTED = Counter(
+    'savant_chat_admission_rejected',
+    'Chat requests answered with 429, by reason (queue_full, timeout)',
+    ['reason']
+)
+
+
+def record_prompt_tokens(model: str, input_tokens: int, cache_read_tokens: int, cache_write_tokens: int) -> None:
+    """Record one model request; input_tokens includes cached tokens"""
+    uncached = max(input_tokens - cache_read_tokens - cache_write_tokens, 0)
+
+    PROMPT_TOKENS.labels(model=model, cache='read').inc(cache_read_tokens)
+    PROMPT_TOKENS.labels(model=model, cache='write').inc(cache_write_tokens)
+    PROMPT_TOKENS.labels(model=model, cache='uncached').inc(uncached)
@@ -0,0 +1,146 @@
+"""
+Chunk Writer
+
+Bulk-inserts document_chunks rows with a binary COPY over a direct Postgres
+connection (SUPABASE_DB_URL). Embeddings are sent in pgvector's binary wire
+format instead of as JSON text through PostgREST, and each document is written
+in a single transaction.
+"""
+
+from psycopg import sql
+from psycopg.adapt import Dumper
+from psycopg.pq import Format
+from psycopg.types import TypeInfo
+from typing import Dict, List, Optional, Sequence
+import psycopg
+import struct
+import uuid
+
+# Columns written by COPY, in order, with their Postgres types
+CHUNK_COLUMNS = [
+    ('id', 'uuid'),
+    ('document_id', 'uuid'),
+    ('savant_id', 'uuid'),
+    ('account_id', 'uuid'),
+    ('chunk_index', 'int4'),
+    ('content', 'text'),
+    ('content_hash', 'text'),
+    ('embedding', 'vector'),
+    ('token_count', 'int4'),
+    ('minhash', 'bytea'),
+    ('lsh_bands', 'int8[]'),
+    ('duplicate_of_chunk_id', 'uuid'),
+]
+
+UUID_COLUMNS = {'id', 'document_id', 'savant_id', 'account_id', 'duplicate_of_chunk_id'}
+
+
+class VectorBinaryDumper(Dumper):
+    """pgvector binary format: int16 dimensions, int16 unused, float4 values (big-endian)"""
+
+    format = Format.BINARY
+
+    def dump(self, obj: List[float]) -> bytes:
+        return struct.pack(f'>HH{len(obj)}f', len(obj), 0, *obj)
+
+
+class ChunkWriter:
+    def __init__(self, db_url: str):
+        # SQLAlchemy-style URLs (used for Agno) are not understood by psycopg
+        self.db_url = db_url.replace("postgresql+psycopg://", "postgresql://", 1)
+        self._conn: Optional[psycopg.Connection] = None
+        self._column_types: List = []
+
+    def _connection(self) -> psycopg.Connection:
+        """Open (or reopen) the connection and register the binary vector dumper"""
+        if self._conn is None or self._conn.closed or self._conn.broken:
+            # prepare_threshold=None keeps the connection usable through PgBouncer/Supavisor
+            conn = psycopg.connect(self.db_url, prepare_threshold=None)
+
+            vector_info = TypeInfo.fetch(conn, 'vector')
+            if vector_info is None:
+                conn.close()
+                raise RuntimeError("pgvector 'vector' type not found in the database")
+
+            dumper = type('VectorBinaryDumper', (VectorBinaryDumper,), {'oid': vector_info.oid})
+            conn.adapters.register_dumper(None, dumper)
+
+            self._column_types = [
+                vector_info.oid if pg_type == 'vector' else pg_type
+                for _, pg_type in CHUNK_COLUMNS
+            ]
+            self._conn = conn
+
+        return self._conn
+
+    def write(self, records: List[Dict], replace_document_id: Optional[str] = None) -> int:
+        """
+        COPY chunk records into document_chunks in one transaction
+
+        Args:
+            records: Chunk rows as built by DocumentProcessor
+            replace_document_id: If set, existing chunks of this document are
+                deleted in the same transaction (makes retries idempotent)
+
+        Returns:
+            Number of rows written
+        """
+        conn = self._connection()
+        with conn.transaction():
+            with conn.cursor() as cur:
+                if replace_document_id:
+                    cur.execute(
+                        "DELETE FROM public.document_chunks WHERE document_id = %s",
+                        (replace_document_id,)
+                    )
+                self._copy(cur, records)
+
+        return len(records)
+
+    def apply_diff(
+        self,
+        document_id: str,
+        delete_ids: Sequence[str],
+        renumber_ids: Sequence[str],
+        renumber_indexes: Sequence[int],
+        records: List[Dict]
+    ) -> int:
+        """
+        Apply an incremental re-ingest in one transaction: delete removed
+        chunks and renumber moved ones (apply_document_chunk_diff), then COPY
+        the new chunk records
+
+        Returns:
+            Number of rows written
+        """
+        conn = self._connection()
+        with conn.transaction():
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT public.apply_document_chunk_diff(%s, %s::uuid[], %s::uuid[], %s::int4[])",
+                    (document_id, list(delete_ids), list(renumber_ids), list(renumber_indexes))
+                )
+                self._copy(cur, records)
+
+        return len(records)
+
+    def _copy(self, cur: psycopg.Cursor, records: List[Dict]) -> None:
+        if not records:
+            return
+
+        copy_sql = sql.SQL("COPY public.document_chunks ({}) FROM STDIN (FORMAT BINARY)").format(
+            sql.SQL(', ').join(sql.Identifier(name) for name, _ in CHUNK_COLUMNS)
+        )
+        # psycopg streams rows to the server in buffered blocks as they are written
+        with cur.copy(copy_sql) as copy:
+            copy.set_types(self._column_types)
+            for record in records:
+                copy.write_row([
+                    uuid.UUID(str(record[name])) if name in UUID_COLUMNS and record[name] else record[name]
+                    for name, _ in CHUNK_COLUMNS
+                ])
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,80 @@
+"""
+Client Disconnect Detection
+
+Stops consuming a stream (an agent run, or a buffered chat response) as soon
+as the client of a streaming response goes away, instead of when the stream
+ends. A watcher polls request.is_disconnected() every DISCONNECT_POLL_SECONDS,
+so disconnects are noticed while nothing is being sent, not only when the
+next chunk fails to send.
+
+The stream is consumed by its own task into an unbounded queue, so that task
+is always waiting on the stream (never parked at a yield) and cancelling it
+stops the stream where it waits; for an agent run, that closes its upstream
+HTTP stream to the provider. This happens however the response ends:
+disconnect detected here, Starlette cancelling the response, or the response
+generator being closed after a failed send.
+"""
+
+from starlette.requests import Request
+from typing import AsyncIterator
+import asyncio
+import os
+
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", 1.0))
+
+_END = object()
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection before the run finished"""
+
+
+async def _wait_for_disconnect(request: Request, poll_interval: float) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(poll_interval)
+
+
+async def _produce(events: AsyncIterator, queue: asyncio.Queue) -> None:
+    try:
+        async for event in events:
+            queue.put_nowait(event)
+    except Exception as e:
+        queue.put_nowait(e)
+    else:
+        queue.put_nowait(_END)
+
+
+async def until_disconnected(
+    events: AsyncIterator,
+    request: Request,
+    poll_interval: float = DISCONNECT_POLL_SECONDS
+) -> AsyncIterator:
+    """
+    Yield from `events` while the client is connected
+
+    `events` is cancelled whenever iteration stops early, for any reason.
+
+    Raises:
+        ClientDisconnected: The client went away
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.create_task(_produce(events, queue))
+    watcher = asyncio.create_task(_wait_for_disconnect(request, poll_interval))
+    try:
+        while True:
+            next_event = asyncio.ensure_future(queue.get())
+            await asyncio.wait({next_event, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                raise ClientDisconnected()
+
+            event = next_event.result()
+            if event is _END:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    finally:
+        watcher.cancel()
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,215 @@
+"""
+Document Download
+
+Streams uploads from Supabase Storage to a local disk cache instead of loading
+them into memory, and hands extractors a memory-mapped view of the file.
+Cache entries are keyed by storage path and ETag and evicted least-recently-used,
+so retried jobs skip the download entirely.
+"""
+
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+from urllib.parse import quote
+import hashlib
+import httpx
+import io
+import mmap
+import os
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "savant-document-cache")
+DEFAULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class MappedFile(io.RawIOBase):
+    """Seekable read-only file object over a memory map (mmap has no seekable() before Python 3.13)"""
+
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._data) if size is None or size < 0 else min(self._pos + size, len(self._data))
+        chunk = self._data[self._pos:end]
+        self._pos = max(end, self._pos)
+        return chunk
+
+    def readinto(self, buffer) -> int:
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._data)
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+class DocumentDownloader:
+    def __init__(
+        self,
+        supabase_url: str,
+        service_role_key: str,
+        bucket: str = 'documents',
+        cache_dir: Optional[str] = None,
+        max_cache_bytes: Optional[int] = None
+    ):
+        self.object_url = f"{supabase_url.rstrip('/')}/storage/v1/object/{bucket}"
+        self.bucket = bucket
+        self.headers = {
+            "Authorization": f"Bearer {service_role_key}",
+            "apikey": service_role_key,
+        }
+        self.cache_dir = cache_dir or os.getenv("DOCUMENT_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_cache_bytes = max_cache_bytes or int(
+            os.getenv("DOCUMENT_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES)
+        )
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.client = httpx.Client(timeout=httpx.Timeout(300.0, connect=10.0))
+
+    @contextmanager
+    def open(self, storage_path: str) -> Iterator[Tuple[object, str]]:
+        """
+        Download (or reuse) a stored document and map it into memory
+
+        Yields:
+            (read-only buffer over the file contents, sha256 hex digest of the file)
+        """
+        local_path, content_hash, cached = self.fetch(storage_path)
+
+        try:
+            with open(local_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    # mmap cannot map empty files
+                    yield b'', content_hash
+                    return
+
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    yield data, content_hash
+        finally:
+            if not cached:
+                os.remove(local_path)
+
+    def fetch(self, storage_path: str) -> Tuple[str, str, bool]:
+        """
+        Return (local file path, sha256, whether the file is kept in the cache)
+        for a stored document, downloading it on cache miss
+        """
+        url = f"{self.object_url}/{quote(storage_path)}"
+
+        etag = self._etag(url)
+        if etag is None:
+            # Without an ETag the object cannot be cached safely
+            fd, local_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            os.close(fd)
+            return local_path, self._download(url, local_path), False
+
+        key = hashlib.sha256(f"{self.bucket}/{storage_path}\n{etag}".encode('utf-8')).hexdigest()
+        local_path = os.path.join(self.cache_dir, f"{key}.bin")
+        hash_path = os.path.join(self.cache_dir, f"{key}.sha256")
+
+        try:
+            with open(hash_path) as f:
+                content_hash = f.read().strip()
+            os.utime(local_path)  # mark as recently used
+            print(f"[DocumentDownloader] Cache hit for {storage_path}")
+            return local_path, content_hash, True
+        except FileNotFoundError:
+            pass
+
+        content_hash = self._download(url, local_path)
+        # The sidecar marks the entry complete, so it is renamed into place too
+        self._write_atomic(hash_path, content_hash)
+
+        self._evict(keep=f"{key}.bin")
+        return local_path, content_hash, True
+
+    def _etag(self, url: str) -> Optional[str]:
+        try:
+            response = self.client.head(url, headers=self.headers)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"[DocumentDownloader] WARNING: could not read object metadata: {str(e)}")
+            return None
+
+        return response.headers.get("etag")
+
+    def _download(self, url: str, local_path: str) -> str:
+        """Stream an object to disk, hashing it on the way; returns the sha256 hex digest"""
+        digest = hashlib.sha256()
+        size = 0
+
+        # Write to a temp file and rename so readers never see a partial download
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with self.client.stream("GET", url, headers=self.headers) as response:
+                    response.raise_for_status()
+                    for block in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        f.write(block)
+                        digest.update(block)
+                        size += len(block)
+            os.replace(tmp_path, local_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        print(f"[DocumentDownloader] Downloaded {size} bytes")
+        return digest.hexdigest()
+
+    def _write_atomic(self, path: str, text: str) -> None:
+        """Write a small file via a temp file and rename, so readers never see it truncated"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _evict(self, keep: str) -> None:
+        """Remove least-recently-used entries (except `keep`) until the cache fits its size budget"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".bin"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        for _, size, name in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            if name == keep:
+                continue
+            key = name[:-len(".bin")]
+            for path in (f"{key}.sha256", name):
+                try:
+                    os.remove(os.path.join(self.cache_dir, path))
+                except FileNotFoundError:
+                    pass
+            total -= size
@@ -8,52 +8,107 @@ Based on Supabase best practices for OpenAI embeddings.
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from supabase import create_client, Client
+from postgrest import ReturnMethod
+from app.services.embedding_cache import EmbeddingCache
+from app.services.chunk_writer import ChunkWriter
+from app.services.document_download import DocumentDownloader, MappedFile
+from app.services.ingestion_profiler import IngestionProfiler
+from app.services.near_duplicates import NearDuplicateIndex, encode_signature, lsh_bands, minhash
+from contextlib import ExitStack
+import asyncio
 import tiktoken
 import os
-from typing import List, Dict
+from typing import Collection, List, Dict, Optional, Tuple
 from io import BytesIO
+import hashlib
+import uuid
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 200
+TOKEN_ENCODING = "cl100k_base"
+
+# Fingerprint of the settings chunks are produced with. Documents are only
+# deduplicated against documents ingested with the same fingerprint.
+INGEST_CONFIG = f"{EMBEDDING_MODEL}:{TOKEN_ENCODING}:size={CHUNK_SIZE}:overlap={CHUNK_OVERLAP}"
+
+# Rows per PostgREST insert when no direct database connection is configured
+INSERT_BATCH_SIZE = 200
+# Chunks per embedding request; each finished batch is saved to the embedding
+# cache, so a retried job only re-embeds the batches that had not completed
+EMBEDDING_BATCH_SIZE = 256
 
 
 class DocumentProcessor:
-    def __init__(self):
-        self.supabase: Client = create_client(
+    def __init__(
+        self,
+        supabase: Optional[Client] = None,
+        embeddings=None,
+        downloader: Optional[DocumentDownloader] = None,
+        chunk_writer: Optional[ChunkWriter] = None
+    ):
+        """
+        Services default to the ones configured in the environment; the
+        ingestion benchmark passes in-memory fakes instead.
+        """
+        self.supabase: Client = supabase or create_client(
             os.getenv("SUPABASE_URL"),
             os.getenv("SUPABASE_SERVICE_ROLE_KEY")
         )
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-ada-002",
+        self.embeddings = embeddings or OpenAIEmbeddings(
+            model=EMBEDDING_MODEL,
             openai_api_key=os.getenv("OPENAI_API_KEY")
         )
+        self.downloader = downloader or DocumentDownloader(
+            os.getenv("SUPABASE_URL"),
+            os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+        )
+        self.embedding_cache = EmbeddingCache(self.supabase, EMBEDDING_MODEL)
+        self.near_duplicates = NearDuplicateIndex(self.supabase)
+        # Binary COPY over a direct connection; falls back to batched PostgREST inserts
+        # (always used with an injected client)
+        db_url = os.getenv("SUPABASE_DB_URL")
+        if chunk_writer is None and supabase is None and db_url:
+            chunk_writer = ChunkWriter(db_url)
+        self.chunk_writer = chunk_writer
         # Chunk size optimized for context windows and token limits
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=200,
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
             length_function=self._token_length,
             separators=["\n\n", "\n", ". ", " ", ""]
         )
 
     def _token_length(self, text: str) -> int:
         """Count tokens using tiktoken (OpenAI's tokenizer)"""
-        encoding = tiktoken.get_encoding("cl100k_base")
+        encoding = tiktoken.get_encoding(TOKEN_ENCODING)
         return len(encoding.encode(text))
 
-    async def process_document(self, message: Dict) -> None:
+    async def process_document(self, message: Dict) -> Dict:
         """
         Main processing pipeline for documents
 
         Steps:
         1. Download file from Supabase Storage
+           (skipped if an identical file was already processed - its chunks are copied)
         2. Extract text based on file type
         3. Clean text (replace newlines per OpenAI best practice)
         4. Split into chunks
         5. Generate embeddings
         6. Store in database
+
+        Messages with `mode: 'update'` re-ingest a replaced document in place:
+        only chunks whose text changed are embedded and inserted.
+
+        Returns:
+            Job profile: per-stage seconds, chunks written and peak RSS
+            (also stored in documents.processing_stats, including for
+            documents completed by copying a duplicate's chunks)
         """
         document_id = message['document_id']
-        account_id = message['account_id']
-        savant_id = message['savant_id']
         storage_path = message['storage_path']
         mime_type = message['mime_type']
+        profiler = IngestionProfiler()
 
         try:
             print(f"[DocumentProcessor] Starting processing for document {document_id}")
@@ -65,61 +120,44 @@ class DocumentProcessor:
                 'processing_started_at': 'now()'
             }).eq('id', document_id).execute()
 
-            # Download file from Supabase Storage
-            print(f"[DocumentProcessor] Downloading file from storage...")
-            file_data = self.supabase.storage.from_('documents').download(storage_path)
-            print(f"[DocumentProcessor] Downloaded {len(file_data)} bytes")
-
-            # Extract text based on mime type
-            print(f"[DocumentProcessor] Extracting text...")
-            text = self._extract_text(file_data, mime_type)
-            print(f"[DocumentProcessor] Extracted {len(text)} characters")
-
-            if not text or len(text.strip()) < 10:
-                raise ValueError("No meaningful text extracted from document")
+            # Cloned savants share the storage object of the original document
+            source = self._find_ingested_duplicate('file_path', storage_path, document_id)
+            if source:
+                return self._copy_from_duplicate(message, source, profiler)
 
-            # Clean text: replace newlines with spaces, remove NULL bytes (OpenAI best practice)
-            cleaned_text = text.replace('\n', ' ').replace('\u0000', '').strip()
+            # A retried job resumes from the chunks saved by the previous attempt;
+            # embeddings finished before the failure are served by the embedding cache
+            checkpoint = self._load_checkpoint(document_id, storage_path)
+            if checkpoint:
+                chunks = checkpoint['chunks']
+                content_hash = checkpoint['content_hash']
+                print(f"[DocumentProcessor] Resuming from checkpoint ({checkpoint['stage']}): {len(chunks)} chunks")
+            else:
+                # Download and parsing run on a thread so concurrent jobs keep making progress
+                prepared = await asyncio.to_thread(self._download_and_chunk, message, profiler)
+                if prepared is None:
+                    return profiler.summary()
+                chunks, content_hash = prepared
+                self._save_checkpoint(document_id, storage_path, content_hash, chunks)
 
-            # Split into chunks
-            print(f"[DocumentProcessor] Splitting into chunks...")
-            chunks = self.text_splitter.split_text(cleaned_text)
-            print(f"[DocumentProcessor] Created {len(chunks)} chunks")
-
-            if not chunks:
-                raise ValueError("No chunks generated from document")
-
-            # Generate embeddings for all chunks (batch processing)
-            print(f"[DocumentProcessor] Generating embeddings for {len(chunks)} chunks...")
-            chunk_embeddings = await self.embeddings.aembed_documents(chunks)
-            print(f"[DocumentProcessor] Generated {len(chunk_embeddings)} embeddings")
-
-            # Prepare chunk records
-            chunk_records = []
-            for idx, (chunk, embedding) in enumerate(zip(chunks, chunk_embeddings)):
-                chunk_records.append({
-                    'account_id': account_id,
-                    'savant_id': savant_id,
-                    'document_id': document_id,
-                    'content': chunk,
-                    'embedding': embedding,
-                    'chunk_index': idx,
-                    'token_count': self._token_length(chunk)
-                })
-
-            # Batch insert chunks
-            print(f"[DocumentProcessor] Inserting {len(chunk_records)} chunks into database...")
-            self.supabase.table('document_chunks').insert(chunk_records).execute()
+            if message.get('mode') == 'update':
+                # Replaced document: only embed and insert chunks that changed
+                chunk_stats = await self._update_chunks(message, chunks, profiler)
+            else:
+                chunk_stats = await self._insert_chunks(message, chunks, profiler)
+            profile = profiler.summary()
 
             # Update document status to completed
-            self.supabase.table('documents').update({
-                'status': 'completed',
-                'processing_completed_at': 'now()',
+            self._mark_completed(message, {
                 'chunk_count': len(chunks),
-                'processing_error': None
-            }).eq('id', document_id).execute()
+                'content_hash': content_hash,
+                'processing_stats': {**chunk_stats, 'profile': profile}
+            })
+            self._clear_checkpoint(document_id)
 
-            print(f"[DocumentProcessor] SUCCESS: Document {document_id} processed - {len(chunks)} chunks created")
+            print(f"[DocumentProcessor] SUCCESS: Document {document_id} processed - {len(chunks)} chunks created "
+                  f"in {profile['total_seconds']}s (stages: {profile['stages']})")
+            return profile
 
         except Exception as e:
             print(f"[DocumentProcessor] ERROR processing document {document_id}: {str(e)}")
@@ -133,9 +171,429 @@ class DocumentProcessor:
             }).eq('id', document_id).execute()
 
             raise
+        finally:
+            profiler.stop()
+
+    def _download_and_chunk(self, message: Dict, profiler: IngestionProfiler) -> Optional[Tuple[List[str], str]]:
+        """
+        Download, extract, clean and split a document
+
+        Returns:
+            (chunks, file content hash), or None if the document was completed
+            by copying the chunks of an identical file
+        """
+        document_id = message['document_id']
+        storage_path = message['storage_path']
+        mime_type = message['mime_type']
+
+        # Stream the file from Supabase Storage to the local cache and map it into memory
+        print(f"[DocumentProcessor] Downloading file from storage...")
+        with ExitStack() as stack:
+            with profiler.stage('download'):
+                file_data, content_hash = stack.enter_context(self.downloader.open(storage_path))
+            print(f"[DocumentProcessor] File ready ({len(file_data)} bytes)")
 
-    def _extract_text(self, file_data: bytes, mime_type: str) -> str:
-        """Extract text from various file formats"""
+            # Identical file uploaded elsewhere - copy its chunks instead of re-processing
+            source = self._find_ingested_duplicate('content_hash', content_hash, document_id)
+            if source:
+                self._copy_from_duplicate(message, source, profiler, content_hash)
+                return None
+
+            # Extract text based on mime type
+            print(f"[DocumentProcessor] Extracting text...")
+            with profiler.stage('extract'):
+                text = self._extract_text(file_data, mime_type)
+            print(f"[DocumentProcessor] Extracted {len(text)} characters")
+
+        if not text or len(text.strip()) < 10:
+            raise ValueError("No meaningful text extracted from document")
+
+        with profiler.stage('chunk'):
+            # Clean text: replace newlines with spaces, remove NULL bytes (OpenAI best practice)
+            cleaned_text = text.replace('\n', ' ').replace('\u0000', '').strip()
+
+            # Split into chunks
+            print(f"[DocumentProcessor] Splitting into chunks...")
+            chunks = self.text_splitter.split_text(cleaned_text)
+        print(f"[DocumentProcessor] Created {len(chunks)} chunks")
+
+        if not chunks:
+            raise ValueError("No chunks generated from document")
+
+        return chunks, content_hash
+
+    async def _insert_chunks(self, message: Dict, chunks: List[str], profiler: IngestionProfiler) -> Dict:
+        """Embed and insert every chunk of a newly uploaded document"""
+        chunk_records, stats = await self._prepare_chunk_records(
+            message, list(range(len(chunks))), chunks, profiler
+        )
+
+        # Replace any chunks left behind by a previous failed attempt
+        print(f"[DocumentProcessor] Inserting {len(chunk_records)} chunks into database...")
+        with profiler.stage('insert'):
+            self._write_chunks(chunk_records, replace_document_id=message['document_id'])
+        profiler.chunks = len(chunk_records)
+
+        return stats
+
+    async def _prepare_chunk_records(
+        self,
+        message: Dict,
+        indexes: List[int],
+        chunks: List[str],
+        profiler: IngestionProfiler,
+        include_document: bool = False,
+        exclude_ids: Collection[str] = ()
+    ) -> Tuple[List[Dict], Dict]:
+        """
+        Detect near-duplicates, embed the remaining chunks and build their rows
+
+        Near-duplicates of a canonical chunk of the same savant (or of an
+        earlier chunk of this batch) become references without an embedding.
+        `include_document` lets existing chunks of the document itself serve
+        as canonical chunks (incremental updates), except `exclude_ids`.
+        """
+        chunk_ids = [str(uuid.uuid4()) for _ in chunks]
+        signatures = [None] * len(chunks)
+        duplicate_of = [None] * len(chunks)
+
+        if self.near_duplicates.enabled:
+            with profiler.stage('dedupe'):
+                signatures = [minhash(chunk) for chunk in chunks]
+                try:
+                    duplicate_of = self.near_duplicates.match(
+                        message['savant_id'], message['document_id'], chunk_ids, signatures,
+                        include_document, exclude_ids
+                    )
+                except Exception as e:
+                    # Detection is an optimization: fall back to embedding every chunk
+                    print(f"[DocumentProcessor] WARNING: near-duplicate lookup failed: {str(e)}")
+            print(f"[DocumentProcessor] Near-duplicates: {sum(1 for ref in duplicate_of if ref)}/{len(chunks)} chunks "
+                  f"stored as references")
+
+        # Generate embeddings for canonical chunks, reusing cached embeddings for identical text
+        unique = [i for i, ref in enumerate(duplicate_of) if ref is None]
+        print(f"[DocumentProcessor] Generating embeddings for {len(unique)} chunks...")
+        with profiler.stage('embed'):
+            unique_embeddings, cache_stats = await self._embed_chunks([chunks[i] for i in unique])
+        print(f"[DocumentProcessor] Generated {len(unique_embeddings)} embeddings "
+              f"(cache hits: {cache_stats['hits']}/{cache_stats['lookups']}, "
+              f"hit rate: {cache_stats['hit_rate']:.0%})")
+
+        chunk_embeddings = [None] * len(chunks)
+        for i, embedding in zip(unique, unique_embeddings):
+            chunk_embeddings[i] = embedding
+
+        chunk_records = self._build_chunk_records(
+            message, indexes, chunks, chunk_embeddings, chunk_ids, signatures, duplicate_of
+        )
+        stats = {
+            'embedding_cache': cache_stats,
+            'near_duplicates': {'chunks': len(chunks), 'references': len(chunks) - len(unique)},
+        }
+        return chunk_records, stats
+
+    async def _update_chunks(self, message: Dict, chunks: List[str], profiler: IngestionProfiler) -> Dict:
+        """
+        Re-ingest a replaced document by diffing chunk hashes against its existing rows
+
+        Unchanged chunks keep their rows (renumbered if they moved), removed chunks
+        are deleted, and only new chunks are embedded and inserted. Nothing is
+        written until the new chunks are embedded, and then the whole diff is
+        applied in one transaction, so a failed attempt leaves the document as
+        it was and the retry diffs against the same rows.
+        """
+        document_id = message['document_id']
+
+        existing = self.supabase.table('document_chunks')\
+            .select('id, chunk_index, content_hash')\
+            .eq('document_id', document_id)\
+            .order('chunk_index')\
+            .execute()
+
+        # Existing rows by content hash, in document order (identical chunks may repeat)
+        rows_by_hash: Dict[str, List[Dict]] = {}
+        for row in existing.data or []:
+            rows_by_hash.setdefault(row['content_hash'], []).append(row)
+
+        renumber_ids, renumber_indexes = [], []
+        new_indexes = []
+        kept = 0
+        for idx, chunk in enumerate(chunks):
+            candidates = rows_by_hash.get(self._chunk_hash(chunk))
+            if candidates:
+                row = candidates.pop(0)
+                kept += 1
+                if row['chunk_index'] != idx:
+                    renumber_ids.append(row['id'])
+                    renumber_indexes.append(idx)
+            else:
+                new_indexes.append(idx)
+
+        removed_ids = [row['id'] for rows in rows_by_hash.values() for row in rows]
+
+        print(f"[DocumentProcessor] Chunk diff: {kept} unchanged ({len(renumber_ids)} renumbered), "
+              f"{len(new_indexes)} new, {len(removed_ids)} removed")
+
+        chunk_records: List[Dict] = []
+        stats = {'embedding_cache': None, 'near_duplicates': None}
+        if new_indexes:
+            new_chunks = [chunks[idx] for idx in new_indexes]
+            # Kept chunks of this document are valid canonical chunks for the new ones
+            chunk_records, stats = await self._prepare_chunk_records(
+                message, new_indexes, new_chunks, profiler, include_document=True, exclude_ids=set(removed_ids)
+            )
+
+        # Delete removed rows, renumber moved rows and insert new rows in one transaction
+        if removed_ids or renumber_ids or chunk_records:
+            print(f"[DocumentProcessor] Applying chunk diff ({len(chunk_records)} new rows)...")
+            with profiler.stage('insert'):
+                self._apply_chunk_diff(document_id, removed_ids, renumber_ids, renumber_indexes, chunk_records)
+            profiler.chunks = len(chunk_records)
+
+        return {
+            **stats,
+            'update': {
+                'unchanged': kept,
+                'renumbered': len(renumber_ids),
+                'inserted': len(new_indexes),
+                'deleted': len(removed_ids),
+            }
+        }
+
+    def _write_chunks(self, chunk_records: List[Dict], replace_document_id: Optional[str] = None) -> None:
+        """Write chunk rows via binary COPY, or batched PostgREST inserts without SUPABASE_DB_URL"""
+        if self.chunk_writer:
+            self.chunk_writer.write(chunk_records, replace_document_id=replace_document_id)
+            return
+
+        if replace_document_id:
+            self.supabase.table('document_chunks').delete().eq('document_id', replace_document_id).execute()
+
+        rows = self._postgrest_rows(chunk_records)
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            self.supabase.table('document_chunks')\
+                .insert(rows[start:start + INSERT_BATCH_SIZE], returning=ReturnMethod.minimal)\
+                .execute()
+
+    def _apply_chunk_diff(
+        self,
+        document_id: str,
+        delete_ids: List[str],
+        renumber_ids: List[str],
+        renumber_indexes: List[int],
+        chunk_records: List[Dict]
+    ) -> None:
+        """Delete, renumber and insert chunk rows of a document in one transaction"""
+        if self.chunk_writer:
+            self.chunk_writer.apply_diff(document_id, delete_ids, renumber_ids, renumber_indexes, chunk_records)
+            return
+
+        self.supabase.rpc('apply_document_chunk_diff', {
+            'p_document_id': document_id,
+            'p_delete_ids': delete_ids,
+            'p_renumber_ids': renumber_ids,
+            'p_renumber_indexes': renumber_indexes,
+            'p_new_chunks': self._postgrest_rows(chunk_records)
+        }).execute()
+
+    def _postgrest_rows(self, chunk_records: List[Dict]) -> List[Dict]:
+        """bytea goes through PostgREST as hex text"""
+        return [
+            {**record, 'minhash': '\\x' + record['minhash'].hex()} if record.get('minhash') else record
+            for record in chunk_records
+        ]
+
+    def _build_chunk_records(
+        self,
+        message: Dict,
+        indexes: List[int],
+        chunks: List[str],
+        embeddings: List[Optional[List[float]]],
+        chunk_ids: List[str],
+        signatures: List,
+        duplicate_of: List[Optional[str]]
+    ) -> List[Dict]:
+        """Prepare document_chunks rows for the given chunk positions"""
+        chunk_records = []
+        for idx, chunk, embedding, chunk_id, signature, canonical_id in zip(
+            indexes, chunks, embeddings, chunk_ids, signatures, duplicate_of
+        ):
+            # References carry no embedding and are not part of the LSH index
+            canonical = canonical_id is None and signature is not None
+            chunk_records.append({
+                'id': chunk_id,
+                'account_id': message['account_id'],
+                'savant_id': message['savant_id'],
+                'document_id': message['document_id'],
+                'content': chunk,
+                'content_hash': self._chunk_hash(chunk),
+                'embedding': embedding,
+                'chunk_index': idx,
+                'token_count': self._token_length(chunk),
+                'minhash': encode_signature(signature) if canonical else None,
+                'lsh_bands': lsh_bands(signature) if canonical else None,
+                'duplicate_of_chunk_id': canonical_id
+            })
+
+        return chunk_records
+
+    def _chunk_hash(self, chunk: str) -> str:
+        """Stable hash of a chunk's text, used to diff re-uploaded documents"""
+        return hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+
+    def _load_checkpoint(self, document_id: str, storage_path: str) -> Optional[Dict]:
+        """Chunks saved by a previous attempt at this document, if still valid"""
+        try:
+            result = self.supabase.table('document_checkpoints')\
+                .select('stage, content_hash, chunks')\
+                .eq('document_id', document_id)\
+                .eq('storage_path', storage_path)\
+                .eq('ingest_config', INGEST_CONFIG)\
+                .limit(1)\
+                .execute()
+        except Exception as e:
+            print(f"[DocumentProcessor] WARNING: checkpoint lookup failed: {str(e)}")
+            return None
+
+        return result.data[0] if result.data else None
+
+    def _save_checkpoint(self, document_id: str, storage_path: str, content_hash: str, chunks: List[str]) -> None:
+        """Save the chunked text so a retry can skip download, extraction and chunking"""
+        try:
+            self.supabase.table('document_checkpoints').upsert({
+                'document_id': document_id,
+                'storage_path': storage_path,
+                'ingest_config': INGEST_CONFIG,
+                'content_hash': content_hash,
+                'stage': 'chunked',
+                'chunks': chunks,
+                'updated_at': 'now()'
+            }, on_conflict='document_id', returning=ReturnMethod.minimal).execute()
+        except Exception as e:
+            print(f"[DocumentProcessor] WARNING: checkpoint save failed: {str(e)}")
+
+    def _clear_checkpoint(self, document_id: str) -> None:
+        try:
+            self.supabase.table('document_checkpoints').delete().eq('document_id', document_id).execute()
+        except Exception as e:
+            print(f"[DocumentProcessor] WARNING: checkpoint cleanup failed: {str(e)}")
+
+    def _find_ingested_duplicate(self, column: str, value: str, document_id: str) -> Optional[Dict]:
+        """Find another completed document with the same `column` value and ingest settings"""
+        result = self.supabase.table('documents')\
+            .select('id, content_hash')\
+            .eq(column, value)\
+            .eq('ingest_config', INGEST_CONFIG)\
+            .eq('status', 'completed')\
+            .neq('id', document_id)\
+            .limit(1)\
+            .execute()
+
+        return result.data[0] if result.data else None
+
+    def _copy_from_duplicate(
+        self,
+        message: Dict,
+        source: Dict,
+        profiler: IngestionProfiler,
+        content_hash: Optional[str] = None
+    ) -> Dict:
+        """
+        Copy chunk rows from an identical, already-processed document server-side
+
+        Returns:
+            Job profile (also stored in documents.processing_stats)
+        """
+        document_id = message['document_id']
+
+        print(f"[DocumentProcessor] Identical document {source['id']} already processed, copying chunks...")
+        with profiler.stage('copy'):
+            result = self.supabase.rpc('copy_document_chunks', {
+                'p_source_document_id': source['id'],
+                'p_target_document_id': document_id,
+                'p_target_savant_id': message['savant_id'],
+                'p_target_account_id': message['account_id']
+            }).execute()
+        chunk_count = result.data or 0
+
+        if not chunk_count:
+            raise ValueError(f"No chunks copied from duplicate document {source['id']}")
+        profiler.chunks = chunk_count
+        profile = profiler.summary()
+
+        self._mark_completed(message, {
+            'chunk_count': chunk_count,
+            'content_hash': content_hash or source.get('content_hash'),
+            'processing_stats': {'deduplicated_from': source['id'], 'profile': profile}
+        })
+
+        print(f"[DocumentProcessor] SUCCESS: Document {document_id} deduplicated - {chunk_count} chunks copied")
+        return profile
+
+    def _mark_completed(self, message: Dict, fields: Dict) -> None:
+        """Mark a document completed; a replaced document also gets its new file path"""
+        completed_fields = {
+            'status': 'completed',
+            'processing_completed_at': 'now()',
+            'processing_error': None,
+            'ingest_config': INGEST_CONFIG,
+            **fields
+        }
+        if message.get('mode') == 'update':
+            completed_fields['file_path'] = message['storage_path']
+        self.supabase.table('documents').update(completed_fields).eq('id', message['document_id']).execute()
+
+    async def _embed_chunks(self, chunks: List[str]) -> Tuple[List[List[float]], Dict]:
+        """
+        Embed chunks, consulting the embedding cache first
+
+        Only unique cache misses are sent to OpenAI; new embeddings are written
+        back to the cache. Cache errors never fail the job - they degrade to a
+        full embedding pass.
+
+        Returns:
+            (embeddings in chunk order, cache statistics for this job)
+        """
+        keys = [self.embedding_cache.key(chunk) for chunk in chunks]
+        unique_keys = list(dict.fromkeys(keys))
+
+        try:
+            cached = self.embedding_cache.get_many(unique_keys)
+        except Exception as e:
+            print(f"[DocumentProcessor] WARNING: embedding cache lookup failed: {str(e)}")
+            cached = {}
+
+        # Embed each distinct missing text once
+        text_by_key = dict(zip(keys, chunks))
+        missing_keys = [key for key in unique_keys if key not in cached]
+        for start in range(0, len(missing_keys), EMBEDDING_BATCH_SIZE):
+            batch_keys = missing_keys[start:start + EMBEDDING_BATCH_SIZE]
+            new_embeddings = await self.embeddings.aembed_documents(
+                [text_by_key[key] for key in batch_keys]
+            )
+            fresh = dict(zip(batch_keys, new_embeddings))
+
+            try:
+                self.embedding_cache.put_many(fresh)
+            except Exception as e:
+                print(f"[DocumentProcessor] WARNING: embedding cache store failed: {str(e)}")
+
+            cached.update(fresh)
+
+        hits = len(unique_keys) - len(missing_keys)
+        stats = {
+            'model': EMBEDDING_MODEL,
+            'lookups': len(unique_keys),
+            'hits': hits,
+            'misses': len(missing_keys),
+            'hit_rate': round(hits / len(unique_keys), 4) if unique_keys else 0.0,
+        }
+
+        return [cached[key] for key in keys], stats
+
+    def _extract_text(self, file_data, mime_type: str) -> str:
+        """Extract text from various file formats (bytes or a memory-mapped file)"""
         if mime_type == 'application/pdf':
             return self._extract_pdf(file_data)
         elif mime_type in [
@@ -144,15 +602,22 @@ class DocumentProcessor:
         ]:
             return self._extract_docx(file_data)
         elif mime_type.startswith('text/'):
-            return file_data.decode('utf-8')
+            return str(file_data, 'utf-8')
         else:
             raise ValueError(f"Unsupported file type: {mime_type}")
 
-    def _extract_pdf(self, file_data: bytes) -> str:
+    def _as_stream(self, file_data):
+        """Seekable stream over the file; memory-mapped files are read in place without copying"""
+        if isinstance(file_data, (bytes, bytearray)):
+            return BytesIO(file_data)
+
+        return MappedFile(file_data)
+
+    def _extract_pdf(self, file_data) -> str:
         """Extract text from PDF files"""
         from pypdf import PdfReader
 
-        reader = PdfReader(BytesIO(file_data))
+        reader = PdfReader(self._as_stream(file_data))
         text = ""
         for page in reader.pages:
             page_text = page.extract_text()
@@ -161,11 +626,11 @@ class DocumentProcessor:
 
         return text.strip()
 
-    def _extract_docx(self, file_data: bytes) -> str:
+    def _extract_docx(self, file_data) -> str:
         """Extract text from DOCX files"""
         from docx import Document
 
-        doc = Document(BytesIO(file_data))
+        doc = Document(self._as_stream(file_data))
         paragraphs = [para.text for para in doc.paragraphs if para.text.strip()]
 
         return "\n".join(paragraphs)
@@ -0,0 +1,66 @@
+"""
+Embedding Cache
+
+Content-addressed cache of chunk embeddings stored in the `embedding_cache` table.
+Entries are keyed by sha256(model, chunk text) so identical chunks from cloned
+savants and re-uploaded documents are only embedded once.
+"""
+
+from supabase import Client
+from postgrest import ReturnMethod
+from typing import Dict, Iterable, List
+import hashlib
+import json
+
+# Keys per PostgREST request (keeps the `in` filter well under URL length limits)
+LOOKUP_BATCH_SIZE = 100
+# Rows per upsert request
+STORE_BATCH_SIZE = 200
+
+
+class EmbeddingCache:
+    def __init__(self, supabase: Client, model: str):
+        self.supabase = supabase
+        self.model = model
+
+    def key(self, text: str) -> str:
+        """Cache key for a chunk of text under the configured model"""
+        return hashlib.sha256(f"{self.model}\n{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """Fetch cached embeddings; missing keys are simply absent from the result"""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[start:start + LOOKUP_BATCH_SIZE]
+            result = self.supabase.table('embedding_cache')\
+                .select('content_hash, embedding')\
+                .in_('content_hash', batch)\
+                .execute()
+
+            for row in result.data or []:
+                embedding = row['embedding']
+                # PostgREST returns pgvector columns as their text form "[0.1,0.2,...]"
+                if isinstance(embedding, str):
+                    embedding = json.loads(embedding)
+                found[row['content_hash']] = embedding
+
+        return found
+
+    def put_many(self, entries: Dict[str, List[float]]) -> None:
+        """Store embeddings, ignoring keys that another job already cached"""
+        rows = [
+            {'content_hash': key, 'model': self.model, 'embedding': embedding}
+            for key, embedding in entries.items()
+        ]
+
+        for start in range(0, len(rows), STORE_BATCH_SIZE):
+            self.supabase.table('embedding_cache')\
+                .upsert(
+                    rows[start:start + STORE_BATCH_SIZE],
+                    on_conflict='content_hash',
+                    ignore_duplicates=True,
+                    returning=ReturnMethod.minimal
+                )\
+                .execute()
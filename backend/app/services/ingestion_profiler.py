@@ -0,0 +1,105 @@
+"""
+Ingestion Profiler
+
+Times the stages of a document processing job (download, extract, chunk,
+embed, insert). The summary is stored in documents.processing_stats and
+exported as worker metrics.
+
+Memory is measured per job: a sampler thread reads the process RSS every
+INGEST_RSS_SAMPLE_SECONDS while the job runs, and the summary reports the
+peak seen and how far it rose above the RSS at the start of the job. RSS is
+process-wide, so jobs running concurrently in the same worker still show up
+in each other's numbers.
+"""
+
+from contextlib import contextmanager
+from typing import Dict, Optional
+import os
+import resource
+import sys
+import threading
+import time
+
+INGEST_RSS_SAMPLE_SECONDS = float(os.getenv("INGEST_RSS_SAMPLE_SECONDS", 0.05))
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process so far (lifetime high-water mark)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class IngestionProfiler:
+    def __init__(self, sample_interval: float = INGEST_RSS_SAMPLE_SECONDS):
+        self.stages: Dict[str, float] = {}
+        self.chunks = 0
+        self._started = time.perf_counter()
+        # Stages run on the event loop and on worker threads
+        self._lock = threading.Lock()
+
+        self._start_rss = current_rss_bytes()
+        self._peak_rss = self._start_rss
+        self._stopped = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        if self._start_rss is None:
+            # No current RSS to sample: fall back to the lifetime peak, which
+            # only moves when this job raises it
+            self._start_rss = self._peak_rss = peak_rss_bytes()
+        else:
+            self._sampler = threading.Thread(
+                target=self._sample_rss, args=(sample_interval,), name="ingestion-rss-sampler", daemon=True
+            )
+            self._sampler.start()
+
+    def _sample_rss(self, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            self._record_rss()
+
+    def _record_rss(self) -> None:
+        rss = current_rss_bytes() if self._sampler else peak_rss_bytes()
+        if rss is not None:
+            with self._lock:
+                self._peak_rss = max(self._peak_rss, rss)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Add the time spent in the block to stage `name`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            self._record_rss()
+
+    def stop(self) -> None:
+        """Stop sampling memory (idempotent; summary() calls it)"""
+        if not self._stopped.is_set():
+            self._record_rss()
+            self._stopped.set()
+
+    def summary(self) -> Dict:
+        """Stage timings in seconds, chunk count, and peak RSS during the job"""
+        self.stop()
+        total = time.perf_counter() - self._started
+        return {
+            'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            'total_seconds': round(total, 3),
+            'chunks': self.chunks,
+            'chunks_per_second': round(self.chunks / total, 2) if total > 0 else 0.0,
+            'peak_rss_bytes': self._peak_rss,
+            'rss_growth_bytes': self._peak_rss - self._start_rss,
+        }
@@ -0,0 +1,155 @@
+"""
+Near-Duplicate Chunk Detection
+
+MinHash signatures over word shingles estimate the Jaccard similarity of two
+chunks; LSH band hashes of the signatures (stored in document_chunks.lsh_bands,
+see 022_near_duplicate_chunks.sql) find candidates among the chunks of the same
+savant without comparing against every row.
+
+A chunk whose estimated similarity to an existing canonical chunk reaches
+NEAR_DUPLICATE_THRESHOLD is stored as a reference to it instead of a new
+embedded row. Set NEAR_DUPLICATE_THRESHOLD=0 to disable detection.
+
+The permutation seed, signature size and banding are part of the stored data:
+changing them makes existing signatures incomparable with new ones.
+"""
+
+from supabase import Client
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+import mmh3
+import numpy as np
+import os
+import re
+
+NUM_PERM = 128
+# 16 bands x 8 rows: pairs at 0.9 similarity share a band with >99.9% probability
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_WORDS = 5
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", 0.9))
+
+# Chunks per candidate lookup request
+LOOKUP_BATCH_SIZE = 200
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_permutations = np.random.RandomState(1)
+_PERM_A = _permutations.randint(1, 2 ** 32, NUM_PERM, dtype=np.uint64)
+_PERM_B = _permutations.randint(0, 2 ** 32, NUM_PERM, dtype=np.uint64)
+
+_WORD = re.compile(r"\w+")
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values) of the text's word shingles"""
+    words = _WORD.findall(text.lower())
+    shingles = {
+        " ".join(words[i:i + SHINGLE_WORDS])
+        for i in range(max(len(words) - SHINGLE_WORDS + 1, 1))
+    }
+    hashes = np.fromiter(
+        (mmh3.hash(shingle, signed=False) for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+    # Universal hashing (a*x + b) mod p, one permutation per row
+    permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def lsh_bands(signature: np.ndarray) -> List[int]:
+    """Signed 64-bit hash per band; the band number is mixed in so bands never collide"""
+    return [
+        mmh3.hash64(
+            bytes([band]) + signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].astype('<u4').tobytes(),
+            signed=True
+        )[0]
+        for band in range(LSH_BANDS)
+    ]
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def encode_signature(signature: np.ndarray) -> bytes:
+    return signature.astype('<u4').tobytes()
+
+
+def decode_signature(value) -> np.ndarray:
+    """Signature from bytea (bytes, or PostgREST's "\\x..." hex text)"""
+    if isinstance(value, str):
+        value = bytes.fromhex(value[2:] if value.startswith('\\x') else value)
+    return np.frombuffer(value, dtype='<u4')
+
+
+class NearDuplicateIndex:
+    def __init__(self, supabase: Client, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.supabase = supabase
+        self.threshold = threshold
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def match(
+        self,
+        savant_id: str,
+        document_id: str,
+        chunk_ids: Sequence[str],
+        signatures: Sequence[np.ndarray],
+        include_document: bool = False,
+        exclude_ids: Collection[str] = ()
+    ) -> List[Optional[str]]:
+        """
+        Canonical chunk id for each near-duplicate chunk, None for new content
+
+        Candidates are the savant's existing canonical chunks and earlier
+        chunks of this batch. Existing chunks of the document itself are only
+        candidates with `include_document` (incremental updates keep them);
+        `exclude_ids` are rows about to be deleted.
+        """
+        bands = [lsh_bands(signature) for signature in signatures]
+
+        # band hash -> [(chunk id, signature)]
+        index: Dict[int, List[Tuple[str, np.ndarray]]] = {}
+        loaded = set()
+        for start in range(0, len(bands), LOOKUP_BATCH_SIZE):
+            query_bands = sorted({band for chunk_bands in bands[start:start + LOOKUP_BATCH_SIZE] for band in chunk_bands})
+            result = self.supabase.rpc('find_near_duplicate_chunks', {
+                'p_savant_id': savant_id,
+                'p_document_id': document_id,
+                'p_lsh_bands': query_bands,
+                'p_include_document': include_document
+            }).execute()
+
+            for row in result.data or []:
+                # Rows sharing bands with several batches are returned more than once
+                if row['id'] in loaded or row['id'] in exclude_ids:
+                    continue
+                loaded.add(row['id'])
+                candidate = (row['id'], decode_signature(row['minhash']))
+                for band in row['lsh_bands']:
+                    index.setdefault(band, []).append(candidate)
+
+        matches: List[Optional[str]] = []
+        for chunk_id, signature, chunk_bands in zip(chunk_ids, signatures, bands):
+            best_id, best_similarity = None, self.threshold
+            seen = set()
+            for band in chunk_bands:
+                for candidate_id, candidate_signature in index.get(band, ()):
+                    if candidate_id in seen:
+                        continue
+                    seen.add(candidate_id)
+                    score = similarity(signature, candidate_signature)
+                    if score >= best_similarity:
+                        best_id, best_similarity = candidate_id, score
+            matches.append(best_id)
+
+            # New content: later chunks of this batch may refer to it
+            if best_id is None:
+                for band in chunk_bands:
+                    index.setdefault(band, []).append((chunk_id, signature))
+
+        return matches
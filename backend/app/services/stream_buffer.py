@@ -0,0 +1,274 @@
+"""
+Resumable Chat Streams
+
+Every chat response is produced by a background run that writes its SSE
+frames into a StreamBuffer, keyed by conversation and message id; client
+connections only read from the buffer. Each frame carries an SSE id of the
+form "<message_id>:<seq>", so a client that lost the connection can reconnect
+with Last-Event-ID, get the frames it missed replayed, and keep tailing the
+live run. Reconnects never start another agent run.
+
+The buffer is a ring of the last STREAM_BUFFER_MAX_FRAMES frames. If
+STREAM_BUFFER_SPILL_DIR is set, frames pushed out of the ring are appended to
+a JSON-lines file there, so long answers stay fully resumable; without it,
+resuming from an evicted frame fails (StreamGone). The spill file stays open
+for the life of the buffer, so spilling a frame is a buffered write; reading
+spilled frames back runs on a thread.
+
+When the last client disconnects, the run gets STREAM_RESUME_GRACE_SECONDS
+to be reattached before it is cancelled. Finished buffers are kept for
+STREAM_BUFFER_TTL_SECONDS for late reconnects.
+
+Buffers live in the worker process that runs the agent, so reconnects must
+reach the same worker (sticky sessions when running several).
+"""
+
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, BinaryIO, Tuple
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+STREAM_BUFFER_MAX_FRAMES = int(os.getenv("STREAM_BUFFER_MAX_FRAMES", 4096))
+STREAM_BUFFER_SPILL_DIR = os.getenv("STREAM_BUFFER_SPILL_DIR")
+STREAM_BUFFER_TTL_SECONDS = float(os.getenv("STREAM_BUFFER_TTL_SECONDS", 120))
+STREAM_RESUME_GRACE_SECONDS = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", 15))
+
+Frame = Tuple[int, Dict[str, Any]]
+
+
+class StreamGone(Exception):
+    """The requested frames are no longer buffered"""
+
+
+def format_frame(message_id: str, seq: int, payload: Dict[str, Any]) -> str:
+    return f"id: {message_id}:{seq}\ndata: {json.dumps(payload)}\n\n"
+
+
+def parse_event_id(event_id: str) -> Tuple[str, int]:
+    """(message_id, seq) of an SSE event id; raises ValueError if malformed"""
+    message_id, _, seq = event_id.strip().rpartition(':')
+    if not message_id:
+        raise ValueError(f"Invalid event id: {event_id}")
+    return message_id, int(seq)
+
+
+class StreamBuffer:
+    def __init__(
+        self,
+        conversation_id: str,
+        message_id: str,
+        account_id: str,
+        max_frames: int = STREAM_BUFFER_MAX_FRAMES,
+        spill_dir: Optional[str] = STREAM_BUFFER_SPILL_DIR
+    ):
+        self.conversation_id = conversation_id
+        self.message_id = message_id
+        self.account_id = account_id
+        self.finished = False
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+        # Pending cancellation after the last client left
+        self.abandon_timer: Optional[asyncio.TimerHandle] = None
+
+        self._frames: Deque[Frame] = deque(maxlen=max(max_frames, 1))
+        self._last_seq = 0
+        self._spilled_seq = 0
+        self._spill_path = os.path.join(spill_dir, f"{message_id}.jsonl") if spill_dir else None
+        # Binary, so the buffered writer's lock covers flushes from reader threads
+        self._spill_file: Optional[BinaryIO] = None
+        self._updated = asyncio.Event()
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def append(self, payload: Dict[str, Any]) -> int:
+        """Add a frame (from the run); returns its sequence number"""
+        if len(self._frames) == self._frames.maxlen:
+            self._spill(self._frames[0])
+
+        self._last_seq += 1
+        self._frames.append((self._last_seq, payload))
+        self._notify()
+        return self._last_seq
+
+    def finish(self) -> None:
+        self.finished = True
+        self._notify()
+
+    def _notify(self) -> None:
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    def _spill(self, frame: Frame) -> None:
+        if self._spill_path is None:
+            return
+        try:
+            if self._spill_file is None:
+                self._spill_file = open(self._spill_path, 'ab')
+            self._spill_file.write((json.dumps(frame) + "\n").encode())
+            self._spilled_seq = frame[0]
+        except OSError as e:
+            logger.warning(f"[StreamBuffer] Could not spill frame of {self.message_id}: {str(e)}")
+
+    async def frames_after(self, seq: int) -> List[Frame]:
+        """
+        Buffered frames with a sequence number above `seq`
+
+        Raises:
+            StreamGone: Some of them were evicted and not spilled
+        """
+        first = self._frames[0][0] if self._frames else self._last_seq + 1
+        if seq + 1 >= first:
+            return [frame for frame in self._frames if frame[0] > seq]
+
+        if self._spill_file is None or self._spilled_seq != first - 1:
+            raise StreamGone(f"Frames after {seq} of {self.message_id} are no longer buffered")
+
+        # Frames spilled while the file is read are still in this copy of the ring
+        ring = list(self._frames)
+        spilled = await asyncio.to_thread(self._read_spill, seq, first - 1)
+        return spilled + ring
+
+    def _read_spill(self, seq: int, last: int) -> List[Frame]:
+        """Spilled frames from `seq` + 1 to `last` (runs on a thread)"""
+        gone = StreamGone(f"Frames after {seq} of {self.message_id} are no longer buffered")
+        frames = []
+        try:
+            self._spill_file.flush()
+            with open(self._spill_path) as f:
+                for line in f:
+                    spilled_seq, payload = json.loads(line)
+                    if spilled_seq > last:
+                        break
+                    if spilled_seq > seq:
+                        # A frame that failed to spill leaves a gap
+                        if spilled_seq != seq + 1 + len(frames):
+                            raise gone
+                        frames.append((spilled_seq, payload))
+        except (OSError, ValueError) as e:
+            logger.warning(f"[StreamBuffer] Could not read spilled frames of {self.message_id}: {str(e)}")
+            raise gone
+        if len(frames) != last - seq:
+            raise gone
+        return frames
+
+    async def tail(self, after: int = 0) -> AsyncIterator[Frame]:
+        """Frames after `after`, then live ones until the run finishes"""
+        seq = after
+        while True:
+            updated = self._updated
+            frames = await self.frames_after(seq)
+            for frame in frames:
+                yield frame
+            if frames:
+                seq = frames[-1][0]
+            elif self.finished:
+                return
+            else:
+                await updated.wait()
+
+    def remove_spill(self) -> None:
+        if self._spill_file is not None:
+            try:
+                self._spill_file.close()
+            except OSError:
+                pass
+            self._spill_file = None
+        if self._spill_path and os.path.exists(self._spill_path):
+            try:
+                os.remove(self._spill_path)
+            except OSError as e:
+                logger.warning(f"[StreamBuffer] Could not remove {self._spill_path}: {str(e)}")
+
+
+class StreamBufferRegistry:
+    def __init__(self):
+        self._buffers: Dict[Tuple[str, str], StreamBuffer] = {}
+        self._latest: Dict[str, str] = {}
+
+    def create(self, conversation_id: str, message_id: str, account_id: str) -> StreamBuffer:
+        if STREAM_BUFFER_SPILL_DIR:
+            os.makedirs(STREAM_BUFFER_SPILL_DIR, exist_ok=True)
+        buffer = StreamBuffer(conversation_id, message_id, account_id)
+        self._buffers[(conversation_id, message_id)] = buffer
+        self._latest[conversation_id] = message_id
+        return buffer
+
+    def get(self, conversation_id: str, message_id: Optional[str] = None) -> Optional[StreamBuffer]:
+        """A conversation's buffer for `message_id`, or its most recent one"""
+        message_id = message_id or self._latest.get(conversation_id)
+        if not message_id:
+            return None
+        return self._buffers.get((conversation_id, message_id))
+
+    def attach(self, buffer: StreamBuffer) -> None:
+        buffer.subscribers += 1
+        self._cancel_abandon(buffer)
+
+    def detach(self, buffer: StreamBuffer) -> None:
+        """A client went away; cancel the run if nobody reattaches within the grace period"""
+        buffer.subscribers -= 1
+        if buffer.subscribers == 0 and not buffer.finished:
+            logger.info(f"[StreamBuffer] Client left {buffer.conversation_id}, waiting {STREAM_RESUME_GRACE_SECONDS:.0f}s for a reconnect")
+            self._cancel_abandon(buffer)
+            buffer.abandon_timer = asyncio.get_running_loop().call_later(
+                STREAM_RESUME_GRACE_SECONDS, self._abandon, buffer
+            )
+
+    def _cancel_abandon(self, buffer: StreamBuffer) -> None:
+        if buffer.abandon_timer is not None:
+            buffer.abandon_timer.cancel()
+            buffer.abandon_timer = None
+
+    def _abandon(self, buffer: StreamBuffer) -> None:
+        buffer.abandon_timer = None
+        if buffer.subscribers == 0 and not buffer.finished and buffer.task is not None:
+            logger.info(f"[StreamBuffer] No reconnect to {buffer.conversation_id}, cancelling its run")
+            buffer.task.cancel()
+
+    def finish(self, buffer: StreamBuffer) -> None:
+        """The run is over; keep the frames for late reconnects, then drop them"""
+        buffer.finish()
+        self._cancel_abandon(buffer)
+        asyncio.get_running_loop().call_later(STREAM_BUFFER_TTL_SECONDS, self._drop, buffer)
+
+    def _drop(self, buffer: StreamBuffer) -> None:
+        key = (buffer.conversation_id, buffer.message_id)
+        if self._buffers.get(key) is buffer:
+            del self._buffers[key]
+        if self._latest.get(buffer.conversation_id) == buffer.message_id:
+            del self._latest[buffer.conversation_id]
+        buffer.remove_spill()
+
+    async def shutdown(self) -> None:
+        """Cancel live runs (they save their partial responses)"""
+        tasks = [buffer.task for buffer in self._buffers.values() if buffer.task and not buffer.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for buffer in list(self._buffers.values()):
+            buffer.remove_spill()
+        self._buffers.clear()
+        self._latest.clear()
+
+
+_registry: Optional[StreamBufferRegistry] = None
+
+
+def get_stream_buffers() -> StreamBufferRegistry:
+    global _registry
+    if _registry is None:
+        _registry = StreamBufferRegistry()
+    return _registry
+
+
+async def shutdown_stream_buffers() -> None:
+    global _registry
+    if _registry is not None:
+        await _registry.shutdown()
+        _registry = None
@@ -0,0 +1,54 @@
+"""
+Queue Notifier
+
+Wakes idle queue workers as soon as a document is queued. Inserts into the
+document queues fire a NOTIFY (see 017_queue_notify.sql); the worker LISTENs on
+a direct Postgres connection (SUPABASE_DB_URL) instead of polling pgmq_read on
+a fixed interval.
+
+The connection must support LISTEN: a direct connection or the session-mode
+pooler, not the transaction-mode pooler (port 6543). A connection that dies
+without being closed would leave the worker waiting for notifications that
+never come, so after LISTEN_HEALTHCHECK_INTERVAL seconds without any the
+connection is checked with a query, and reopened if it does not answer.
+"""
+
+import asyncio
+import psycopg
+
+NOTIFY_CHANNEL = "document_queue"
+# How long to wait before retrying LISTEN after the connection failed
+RECONNECT_INTERVAL = 60
+# Quiet period after which the LISTEN connection is checked
+LISTEN_HEALTHCHECK_INTERVAL = 30
+
+
+class QueueNotifier:
+    def __init__(self, db_url: str, channel: str = NOTIFY_CHANNEL):
+        self.db_url = db_url.replace("postgresql+psycopg://", "postgresql://", 1)
+        self.channel = channel
+        # True while notifications are being received; the worker polls otherwise
+        self.listening = False
+
+    async def run(self, wake: asyncio.Event) -> None:
+        """Set `wake` whenever a queue insert is notified; reconnects after failures"""
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.db_url, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {self.channel}")
+                    self.listening = True
+                    print(f"[QueueNotifier] Listening for queue notifications on '{self.channel}'")
+
+                    # Messages may have been queued while we were not listening
+                    wake.set()
+
+                    while True:
+                        async for _ in conn.notifies(timeout=LISTEN_HEALTHCHECK_INTERVAL):
+                            wake.set()
+                        await asyncio.wait_for(conn.execute("SELECT 1"), LISTEN_HEALTHCHECK_INTERVAL)
+
+            except (psycopg.Error, asyncio.TimeoutError) as e:
+                print(f"[QueueNotifier] WARNING: LISTEN unavailable, falling back to polling: {str(e)}")
+
+            self.listening = False
+            await asyncio.sleep(RECONNECT_INTERVAL)
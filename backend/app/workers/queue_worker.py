@@ -1,104 +1,313 @@
 """
 Queue Worker for Document Processing
 
-Continuously polls the pgmq queue for new document processing jobs.
+Continuously reads the pgmq queues for new document processing jobs.
+When idle, waits for a NOTIFY from the queue (SUPABASE_DB_URL) and falls back
+to exponential-backoff polling if LISTEN is unavailable.
+
+Small documents are routed to a fast-lane queue (see 019_priority_queues.sql).
+The worker runs several jobs at once and reserves some of its slots for the
+fast lane, so small uploads are never stuck behind large ones.
+
+A failed job is retried with exponential visibility backoff. Once a message has
+been read MAX_DELIVERY_ATTEMPTS times it is moved to the dead-letter queue
+(see 020_dead_letter_queue.sql), so one bad upload cannot keep a worker busy.
 """
 
 import asyncio
 from app.services.document_processor import DocumentProcessor
+from app.workers.queue_notifier import QueueNotifier
+from app.workers import worker_metrics
 from supabase import create_client
 import os
+import signal
 import sys
+import threading
+import time
+
+FAST_QUEUE = 'document_processing_fast'
+BULK_QUEUE = 'document_processing'
+# Visibility timeout for read messages; extended by the heartbeat while a job runs
+VISIBILITY_TIMEOUT = 300
+HEARTBEAT_INTERVAL = VISIBILITY_TIMEOUT // 3
+
+# Deliveries before a failing message is dead-lettered, and the retry backoff
+DEAD_LETTER_QUEUE = 'document_processing_dlq'
+MAX_DELIVERY_ATTEMPTS = int(os.getenv("MAX_DELIVERY_ATTEMPTS", 5))
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 3600
+
+# Concurrent jobs per worker, and how many of them only fast-lane jobs may use
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 3))
+FAST_LANE_RESERVED_SLOTS = int(os.getenv("FAST_LANE_RESERVED_SLOTS", 1))
+
+# While listening, re-poll at least this often to pick up messages whose
+# visibility timeout expired (those do not fire a notification)
+IDLE_POLL_INTERVAL = 30
+# Polling backoff when notifications are unavailable
+MIN_POLL_DELAY = 0.25
+MAX_POLL_DELAY = 8.0
+
+
+class VisibilityHeartbeat:
+    """
+    Keeps a message invisible to other workers while it is being processed
+
+    Runs in a thread so the timeout is extended even while CPU-bound extraction
+    blocks the event loop.
+    """
+
+    def __init__(self, supabase, queue_name: str, message_id: int):
+        self.supabase = supabase
+        self.queue_name = queue_name
+        self.message_id = message_id
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
 
+    def __enter__(self):
+        self._thread.start()
+        return self
 
-async def process_queue():
-    """Background worker to process document queue"""
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.supabase.rpc('pgmq_set_vt', {
+                    'queue_name': self.queue_name,
+                    'msg_id': self.message_id,
+                    'vt': VISIBILITY_TIMEOUT
+                }).execute()
+            except Exception as e:
+                print(f"[QueueWorker] WARNING: failed to extend visibility of message {self.message_id}: {str(e)}")
+
+
+def retry_delay(read_count: int) -> int:
+    """Seconds before a message that failed on delivery `read_count` is retried"""
+    return min(RETRY_BASE_DELAY * 2 ** max(read_count - 1, 0), RETRY_MAX_DELAY)
+
+
+async def process_queue(counters=None, worker_index: int = 0):
+    """
+    Background worker to process document queue
+
+    On SIGTERM the worker drains: it stops reading new messages and exits once
+    its running jobs have finished. `counters` (see supervisor.WorkerCounters)
+    records finished jobs for the supervisor's throughput reports, and
+    `worker_index` offsets the Prometheus metrics port (see worker_metrics).
+    """
     print("[QueueWorker] Starting document processing queue worker...")
     print(f"[QueueWorker] Supabase URL: {os.getenv('SUPABASE_URL')}")
-    print(f"[QueueWorker] Polling queue 'document_processing'...")
+    print(f"[QueueWorker] Reading queues '{FAST_QUEUE}' and '{BULK_QUEUE}' "
+          f"({WORKER_CONCURRENCY} slots, {FAST_LANE_RESERVED_SLOTS} reserved for the fast lane)...")
 
     supabase = create_client(
         os.getenv("SUPABASE_URL"),
         os.getenv("SUPABASE_SERVICE_ROLE_KEY")
     )
+    # Separate client for heartbeats, which run on their own threads
+    heartbeat_supabase = create_client(
+        os.getenv("SUPABASE_URL"),
+        os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    )
     processor = DocumentProcessor()
+    worker_metrics.start_metrics_server(worker_index)
+
+    # Set when a document is queued or a job finishes and frees a slot
+    wake = asyncio.Event()
+    db_url = os.getenv("SUPABASE_DB_URL")
+    notifier = QueueNotifier(db_url) if db_url else None
+    if notifier:
+        asyncio.create_task(notifier.run(wake))
 
-    consecutive_errors = 0
-    max_consecutive_errors = 5
-    poll_count = 0
+    # Drain on SIGTERM instead of dying mid-job
+    stopping = asyncio.Event()
+
+    def request_stop() -> None:
+        if not stopping.is_set():
+            print(f"[QueueWorker] Draining: finishing {len(running)} running job(s), not reading new messages...")
+        stopping.set()
+        wake.set()
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, request_stop)
+
+    async def refresh_queue_metrics() -> None:
+        while True:
+            try:
+                worker_metrics.collect_queue_metrics(supabase, [FAST_QUEUE, BULK_QUEUE, DEAD_LETTER_QUEUE])
+            except Exception as e:
+                print(f"[QueueWorker] WARNING: failed to read queue metrics: {str(e)}")
+            await asyncio.sleep(worker_metrics.QUEUE_METRICS_INTERVAL)
+
+    metrics_task = asyncio.create_task(refresh_queue_metrics())
+
+    running = {}  # task -> queue name
+    poll_delay = MIN_POLL_DELAY
+    error_delay = 5
+    last_idle_log = 0.0
+
+    def dead_letter(queue_name: str, msg: dict, error: str) -> None:
+        """
+        Move a message to the dead-letter queue, mark its document failed and
+        drop its checkpoint (nothing will resume from it)
+        """
+        message_id = msg['msg_id']
+        message_data = msg['message']
+        print(f"[QueueWorker] Giving up on message {message_id} after {msg['read_ct']} deliveries, "
+              f"moving it to '{DEAD_LETTER_QUEUE}'")
+
+        supabase.rpc('pgmq_dead_letter', {
+            'queue_name': queue_name,
+            'msg_id': message_id,
+            'dlq_name': DEAD_LETTER_QUEUE,
+            'error': error
+        }).execute()
+        worker_metrics.record_job(queue_name, 'dead_lettered')
+
+        if message_data.get('document_id'):
+            supabase.table('documents').update({
+                'status': 'failed',
+                'processing_error': f"Gave up after {msg['read_ct']} attempts: {error}"
+            }).eq('id', message_data['document_id']).execute()
+            supabase.table('document_checkpoints').delete().eq('document_id', message_data['document_id']).execute()
+
+    def schedule_retry(queue_name: str, msg: dict) -> None:
+        """Hide a failed message for an exponentially growing delay"""
+        delay = retry_delay(msg['read_ct'])
+        supabase.rpc('pgmq_set_vt', {
+            'queue_name': queue_name,
+            'msg_id': msg['msg_id'],
+            'vt': delay
+        }).execute()
+        print(f"[QueueWorker] Retrying message {msg['msg_id']} in {delay}s "
+              f"(attempt {msg['read_ct']} of {MAX_DELIVERY_ATTEMPTS})")
+
+    async def handle_message(queue_name: str, msg: dict) -> None:
+        message_id = msg['msg_id']
+        message_data = msg['message']
+
+        print(f"[QueueWorker] === Received message {message_id} from {queue_name} ===")
+        print(f"[QueueWorker] Document ID: {message_data.get('document_id')}")
+        print(f"[QueueWorker] Storage path: {message_data.get('storage_path')}")
+
+        # Read more often than allowed without recording a failure, e.g. the
+        # worker crashed or was killed mid-job every time
+        if msg['read_ct'] > MAX_DELIVERY_ATTEMPTS:
+            try:
+                dead_letter(queue_name, msg, "Exceeded maximum delivery attempts without completing")
+            except Exception as e:
+                print(f"[QueueWorker] ERROR dead-lettering message {message_id}: {str(e)}")
+            return
 
-    while True:
         try:
-            poll_count += 1
-
-            # Read message from queue
-            # vt = visibility timeout in seconds (how long before message becomes visible again if not deleted)
-            result = supabase.rpc('pgmq_read', {
-                'queue_name': 'document_processing',
-                'vt': 300,  # 5 minute visibility timeout
-                'qty': 1     # Process one message at a time
+            # Process the document, keeping the message invisible until it finishes
+            with VisibilityHeartbeat(heartbeat_supabase, queue_name, message_id):
+                profile = await processor.process_document(message_data)
+
+            # Delete message from queue on success
+            supabase.rpc('pgmq_delete', {
+                'queue_name': queue_name,
+                'msg_id': message_id
             }).execute()
 
-            messages = result.data
+            print(f"[QueueWorker] === Successfully processed message {message_id} ===")
+            worker_metrics.record_job(queue_name, 'succeeded', profile)
+            if counters:
+                counters.record(succeeded=True)
 
-            if messages and len(messages) > 0:
-                for msg in messages:
-                    message_id = msg['msg_id']
-                    message_data = msg['message']
+        except Exception as e:
+            print(f"[QueueWorker] ERROR processing document {message_data.get('document_id')}: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            worker_metrics.record_job(queue_name, 'failed')
+            if counters:
+                counters.record(succeeded=False)
 
-                    print(f"[QueueWorker] === Received message {message_id} ===")
-                    print(f"[QueueWorker] Document ID: {message_data.get('document_id')}")
-                    print(f"[QueueWorker] Storage path: {message_data.get('storage_path')}")
+            # Only this message is affected: back it off or dead-letter it.
+            # If this fails too, the message reappears after its visibility timeout.
+            try:
+                if msg['read_ct'] >= MAX_DELIVERY_ATTEMPTS:
+                    dead_letter(queue_name, msg, str(e))
+                else:
+                    schedule_retry(queue_name, msg)
+            except Exception as retry_error:
+                print(f"[QueueWorker] ERROR rescheduling message {message_id}: {str(retry_error)}")
 
-                    try:
-                        # Process the document
-                        await processor.process_document(message_data)
+    def job_done(task: asyncio.Task) -> None:
+        running.pop(task, None)
+        wake.set()
 
-                        # Delete message from queue on success
-                        supabase.rpc('pgmq_delete', {
-                            'queue_name': 'document_processing',
-                            'msg_id': message_id
-                        }).execute()
+    def start_jobs(queue_name: str, qty: int) -> int:
+        """Read up to `qty` messages from a queue and start a job for each"""
+        if qty <= 0:
+            return 0
 
-                        print(f"[QueueWorker] === Successfully processed message {message_id} ===")
+        # vt = visibility timeout in seconds (how long before message becomes visible again if not deleted)
+        result = supabase.rpc('pgmq_read', {
+            'queue_name': queue_name,
+            'vt': VISIBILITY_TIMEOUT,  # 5 minute visibility timeout, extended while processing
+            'qty': qty
+        }).execute()
 
-                        # Reset error counter on success
-                        consecutive_errors = 0
+        for msg in result.data or []:
+            task = asyncio.create_task(handle_message(queue_name, msg))
+            running[task] = queue_name
+            task.add_done_callback(job_done)
 
-                    except Exception as e:
-                        print(f"[QueueWorker] ERROR processing document {message_data.get('document_id')}: {str(e)}")
-                        import traceback
-                        traceback.print_exc()
-                        consecutive_errors += 1
+        return len(result.data or [])
 
-                        # Message will become visible again after visibility timeout
-                        # This allows for automatic retry
+    while not stopping.is_set():
+        try:
+            wake.clear()
 
-                        if consecutive_errors >= max_consecutive_errors:
-                            print(f"[QueueWorker] Too many consecutive errors ({consecutive_errors}). Pausing for 60 seconds...")
-                            await asyncio.sleep(60)
-                            consecutive_errors = 0
+            # Fast lane first: it may use every free slot
+            free_slots = WORKER_CONCURRENCY - len(running)
+            started = start_jobs(FAST_QUEUE, free_slots)
 
-            else:
-                # No messages in queue, wait before polling again
-                if poll_count % 30 == 0:  # Log every 60 seconds (30 * 2 seconds)
-                    print(f"[QueueWorker] Waiting for messages... (poll #{poll_count})")
-                await asyncio.sleep(2)
+            # Bulk jobs may only use the slots that are not reserved for the fast lane
+            bulk_running = sum(1 for queue_name in running.values() if queue_name == BULK_QUEUE)
+            bulk_slots = min(
+                WORKER_CONCURRENCY - len(running),
+                WORKER_CONCURRENCY - FAST_LANE_RESERVED_SLOTS - bulk_running
+            )
+            started += start_jobs(BULK_QUEUE, bulk_slots)
+            error_delay = 5
+
+            if started:
+                poll_delay = MIN_POLL_DELAY
+                continue
+
+            # Nothing to start: sleep until a document is queued or a slot frees up
+            if not running and time.monotonic() - last_idle_log >= 60:
+                print(f"[QueueWorker] Waiting for messages...")
+                last_idle_log = time.monotonic()
+
+            listening = notifier is not None and notifier.listening
+            try:
+                await asyncio.wait_for(wake.wait(), IDLE_POLL_INTERVAL if listening else poll_delay)
+            except asyncio.TimeoutError:
+                if not listening:
+                    poll_delay = min(poll_delay * 2, MAX_POLL_DELAY)
 
         except KeyboardInterrupt:
             print("\nShutting down queue worker...")
             sys.exit(0)
 
         except Exception as e:
-            print(f"Queue worker error: {str(e)}")
-            consecutive_errors += 1
-
-            if consecutive_errors >= max_consecutive_errors:
-                print(f"Too many consecutive errors ({consecutive_errors}). Pausing for 60 seconds...")
-                await asyncio.sleep(60)
-                consecutive_errors = 0
-            else:
-                await asyncio.sleep(5)
+            # Reading the queue failed (e.g. Supabase unreachable); running jobs carry on
+            print(f"Queue worker error: {str(e)}. Retrying in {error_delay}s...")
+            try:
+                await asyncio.wait_for(stopping.wait(), error_delay)
+            except asyncio.TimeoutError:
+                pass
+            error_delay = min(error_delay * 2, 60)
+
+    if running:
+        await asyncio.gather(*running)
+    metrics_task.cancel()
+    print("[QueueWorker] Drained, exiting")
 
 
 # Use run_worker.py to start this worker
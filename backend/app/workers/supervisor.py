@@ -0,0 +1,157 @@
+"""
+Worker Supervisor
+
+Runs several queue worker processes from one entry point so a worker node
+uses all of its cores. The workers share the pgmq queues, so no coordination
+is needed beyond starting and stopping them:
+
+- crashed workers are restarted with exponential backoff
+- SIGTERM / Ctrl+C is forwarded to the workers, which drain their running
+  jobs before exiting (killed after WORKER_DRAIN_TIMEOUT)
+- per-worker throughput is printed every REPORT_INTERVAL seconds
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+
+# A worker that exits sooner than this after starting counts as crash-looping
+MIN_HEALTHY_UPTIME = 60
+MIN_RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 60.0
+REPORT_INTERVAL = 60
+# Defaults to queue_worker.VISIBILITY_TIMEOUT, after which unfinished jobs are
+# retried elsewhere anyway. Not imported so the supervisor stays lightweight.
+DRAIN_TIMEOUT = int(os.getenv("WORKER_DRAIN_TIMEOUT", 300))
+
+# Child processes start fresh instead of forking the supervisor's state
+_mp = multiprocessing.get_context("spawn")
+
+
+class WorkerCounters:
+    """Job counters shared between a worker process and the supervisor"""
+
+    def __init__(self):
+        self.succeeded = _mp.Value('q', 0)
+        self.failed = _mp.Value('q', 0)
+
+    def record(self, succeeded: bool) -> None:
+        counter = self.succeeded if succeeded else self.failed
+        with counter.get_lock():
+            counter.value += 1
+
+
+def run_worker_process(index: int, counters: WorkerCounters) -> None:
+    """Child process entry point"""
+    # Ctrl+C reaches the whole process group; let the supervisor decide what to do
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from app.workers.queue_worker import process_queue
+
+    print(f"[Worker {index}] Started (pid {os.getpid()})")
+    asyncio.run(process_queue(counters=counters, worker_index=index))
+
+
+class WorkerSlot:
+    """One supervised worker process and its restart state"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.counters = WorkerCounters()
+        self.process = None
+        self.started_at = 0.0
+        self.restart_delay = MIN_RESTART_DELAY
+        self.restart_at = 0.0
+        self.restarts = 0
+        self.reported = (0, 0)  # (succeeded, failed) at the last report
+
+    def start(self) -> None:
+        self.process = _mp.Process(
+            target=run_worker_process,
+            args=(self.index, self.counters),
+            name=f"queue-worker-{self.index}"
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+
+
+class WorkerSupervisor:
+    def __init__(self, processes: int):
+        self.slots = [WorkerSlot(index) for index in range(processes)]
+        self.stopping = False
+
+    def run(self) -> None:
+        """Start the workers and supervise them until SIGTERM / SIGINT"""
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        print(f"[Supervisor] Starting {len(self.slots)} worker processes...")
+        for slot in self.slots:
+            slot.start()
+
+        last_report = time.monotonic()
+        while not self.stopping:
+            now = time.monotonic()
+            for slot in self.slots:
+                self._check(slot, now)
+
+            if now - last_report >= REPORT_INTERVAL:
+                self._report(now - last_report)
+                last_report = now
+
+            time.sleep(1)
+
+        self._drain()
+
+    def _request_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def _check(self, slot: WorkerSlot, now: float) -> None:
+        """Restart a worker that has exited, backing off if it keeps crashing"""
+        if slot.process.is_alive():
+            return
+
+        if slot.restart_at == 0.0:
+            uptime = now - slot.started_at
+            if uptime >= MIN_HEALTHY_UPTIME:
+                slot.restart_delay = MIN_RESTART_DELAY
+            print(f"[Supervisor] Worker {slot.index} (pid {slot.process.pid}) exited with code "
+                  f"{slot.process.exitcode} after {uptime:.0f}s, restarting in {slot.restart_delay:.0f}s")
+            slot.restart_at = now + slot.restart_delay
+            slot.restart_delay = min(slot.restart_delay * 2, MAX_RESTART_DELAY)
+
+        if now >= slot.restart_at:
+            slot.restart_at = 0.0
+            slot.restarts += 1
+            slot.start()
+
+    def _report(self, elapsed: float) -> None:
+        """Print jobs finished per worker since the last report"""
+        total = 0
+        for slot in self.slots:
+            succeeded, failed = slot.counters.succeeded.value, slot.counters.failed.value
+            done = succeeded - slot.reported[0]
+            total += done
+            print(f"[Supervisor] Worker {slot.index}: {done / elapsed * 60:.1f} docs/min "
+                  f"({done} ok, {failed - slot.reported[1]} failed, {slot.restarts} restarts)")
+            slot.reported = (succeeded, failed)
+        print(f"[Supervisor] Total: {total / elapsed * 60:.1f} docs/min")
+
+    def _drain(self) -> None:
+        """Forward SIGTERM to the workers and wait for their jobs to finish"""
+        alive = [slot.process for slot in self.slots if slot.process.is_alive()]
+        print(f"[Supervisor] Stopping {len(alive)} workers (waiting up to {DRAIN_TIMEOUT}s for running jobs)...")
+        for process in alive:
+            process.terminate()  # SIGTERM
+
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        for process in alive:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                print(f"[Supervisor] Worker pid {process.pid} did not drain in time, killing it")
+                process.kill()
+                process.join()
+
+        print("[Supervisor] All workers stopped")
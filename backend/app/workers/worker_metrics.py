@@ -0,0 +1,103 @@
+"""
+Worker Metrics
+
+Prometheus metrics for the document processing worker, served over HTTP on
+WORKER_METRICS_PORT (default 9400; under the supervisor, worker N uses
+port + N; 0 disables the endpoint).
+
+Useful queries:
+- docs/min:    rate(savant_ingest_documents_total{outcome="succeeded"}[5m]) * 60
+- chunks/s:    rate(savant_ingest_chunks_total[5m])
+- slow stage:  histogram_quantile(0.95, rate(savant_ingest_stage_seconds_bucket[15m]))
+"""
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from typing import Dict, List
+import os
+
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 9400))
+# How often queue depth and oldest-message age are refreshed
+QUEUE_METRICS_INTERVAL = 15
+
+DOCUMENTS = Counter(
+    'savant_ingest_documents',
+    'Document jobs finished by the worker',
+    ['queue', 'outcome']
+)
+CHUNKS = Counter(
+    'savant_ingest_chunks',
+    'Chunks embedded and written',
+    ['queue']
+)
+JOB_SECONDS = Histogram(
+    'savant_ingest_job_seconds',
+    'Wall-clock time of successful document jobs',
+    ['queue'],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 3600)
+)
+STAGE_SECONDS = Histogram(
+    'savant_ingest_stage_seconds',
+    'Time spent per ingestion stage',
+    ['stage'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+JOB_PEAK_RSS = Histogram(
+    'savant_ingest_job_peak_rss_bytes',
+    'Worker peak resident memory while each job ran',
+    buckets=tuple(2 ** power * 1024 * 1024 for power in range(6, 14))  # 64 MiB .. 8 GiB
+)
+JOB_RSS_GROWTH = Histogram(
+    'savant_ingest_job_rss_growth_bytes',
+    'Rise of worker resident memory above its level at the start of each job',
+    buckets=tuple(2 ** power * 1024 * 1024 for power in range(0, 12))  # 1 MiB .. 2 GiB
+)
+QUEUE_DEPTH = Gauge(
+    'savant_queue_depth',
+    'Messages in the queue, including ones being processed',
+    ['queue']
+)
+QUEUE_OLDEST_AGE = Gauge(
+    'savant_queue_oldest_message_age_seconds',
+    'Age of the oldest message in the queue',
+    ['queue']
+)
+
+
+def start_metrics_server(worker_index: int = 0) -> None:
+    """Serve /metrics on a background thread; failures only disable metrics"""
+    if not WORKER_METRICS_PORT:
+        return
+
+    port = WORKER_METRICS_PORT + worker_index
+    try:
+        start_http_server(port)
+        print(f"[WorkerMetrics] Serving Prometheus metrics on :{port}/metrics")
+    except OSError as e:
+        print(f"[WorkerMetrics] WARNING: metrics endpoint unavailable on port {port}: {str(e)}")
+
+
+def record_job(queue_name: str, outcome: str, profile: Dict = None) -> None:
+    """Record a finished job; `profile` is the summary returned by process_document"""
+    DOCUMENTS.labels(queue=queue_name, outcome=outcome).inc()
+    if not profile:
+        return
+
+    CHUNKS.labels(queue=queue_name).inc(profile['chunks'])
+    JOB_SECONDS.labels(queue=queue_name).observe(profile['total_seconds'])
+    for stage, seconds in profile['stages'].items():
+        STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    JOB_PEAK_RSS.observe(profile['peak_rss_bytes'])
+    JOB_RSS_GROWTH.observe(profile['rss_growth_bytes'])
+
+
+def collect_queue_metrics(supabase, queue_names: List[str]) -> None:
+    """Refresh queue depth and oldest-message age from pgmq.metrics()"""
+    for queue_name in queue_names:
+        result = supabase.rpc('pgmq_metrics', {'queue_name': queue_name}).execute()
+        if not result.data:
+            continue
+
+        row = result.data[0]
+        QUEUE_DEPTH.labels(queue=queue_name).set(row['queue_length'])
+        # NULL when the queue is empty
+        QUEUE_OLDEST_AGE.labels(queue=queue_name).set(row['oldest_msg_age_sec'] or 0)
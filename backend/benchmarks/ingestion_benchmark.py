@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Document Ingestion Benchmark
+
+Runs synthetic PDF, DOCX and text documents of increasing size through the
+DocumentProcessor pipeline (extraction, cleaning and chunking, embedding and
+chunk record preparation/insert) without network access:
+
+- documents are served from memory instead of Supabase Storage
+- embeddings come from a deterministic fake embedder
+- Supabase writes go to an in-memory sink
+
+Reports chars/s, chunks/s, per-stage wall time and peak Python memory
+(tracemalloc) per document, and exits non-zero when a result regresses more
+than --threshold against the baseline in benchmarks/ingestion_baseline.json
+(or --baseline), or when there is no baseline to compare against. Record it
+once per CI machine, then run the check:
+
+    python benchmarks/ingestion_benchmark.py --save-baseline benchmarks/ingestion_baseline.json
+    python benchmarks/ingestion_benchmark.py
+
+Chunking uses tiktoken's cl100k_base encoding; on an offline machine point
+TIKTOKEN_CACHE_DIR at a directory where it has been downloaded once.
+Baselines are machine-specific: compare runs from the same machine only.
+"""
+
+import sys
+import os
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import gc
+import hashlib
+import json
+import random
+import statistics
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+from io import BytesIO, StringIO
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.services.document_processor import DocumentProcessor
+from app.services.ingestion_profiler import IngestionProfiler
+
+EMBEDDING_DIMENSIONS = 1536
+# Paragraphs per synthetic document (~600 characters each)
+DEFAULT_SIZES = [20, 200, 1000]
+# Shorter timings are dominated by noise and are not checked for regressions
+MIN_COMPARABLE_SECONDS = 0.05
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingestion_baseline.json")
+
+MIME_TYPES = {
+    'pdf': 'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'txt': 'text/plain',
+}
+
+WORDS = (
+    "savant knowledge document upload chunk embedding retrieval context answer brand voice "
+    "customer account policy refund shipping warranty support product feature release team "
+    "onboarding pricing invoice integration security compliance report quarterly revenue "
+    "the a of and to in is for with on that by this be are from as at it or an"
+).split()
+
+
+# ============================================================================
+# Synthetic corpus
+# ============================================================================
+
+def synthetic_paragraphs(count: int, seed: int = 42) -> List[str]:
+    """Deterministic prose-like paragraphs"""
+    rng = random.Random(seed)
+    paragraphs = []
+    for _ in range(count):
+        sentences = []
+        for _ in range(rng.randint(4, 8)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraphs.append(" ".join(sentences))
+    return paragraphs
+
+
+def build_text(paragraphs: List[str]) -> bytes:
+    return "\n\n".join(paragraphs).encode('utf-8')
+
+
+def build_docx(paragraphs: List[str]) -> bytes:
+    from docx import Document
+
+    doc = Document()
+    for paragraph in paragraphs:
+        doc.add_paragraph(paragraph)
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def build_pdf(paragraphs: List[str], line_chars: int = 90, lines_per_page: int = 60) -> bytes:
+    """Minimal multi-page PDF with Helvetica text and a valid xref table"""
+    lines = []
+    for paragraph in paragraphs:
+        words, line = paragraph.split(), ""
+        for word in words:
+            if len(line) + len(word) + 1 > line_chars:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.extend([line, ""])
+
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    def escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    # Object numbers: 1 catalog, 2 page tree, 3 font, then (page, content) pairs
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    page_refs = []
+    for index, page_lines in enumerate(pages):
+        page_id, content_id = 4 + index * 2, 5 + index * 2
+        body = "BT /F1 10 Tf 12 TL 50 780 Td " + " ".join(
+            f"({escape(line)}) Tj T*" for line in page_lines
+        ) + " ET"
+        stream = body.encode('latin-1')
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_refs.append(b"%d 0 R" % page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(page_refs), len(pages))
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = out.tell()
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, objects[number]))
+
+    xref_offset = out.tell()
+    size = max(objects) + 1
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+    for number in range(1, size):
+        out.write(b"%010d 00000 n \n" % offsets[number])
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref_offset))
+    return out.getvalue()
+
+
+BUILDERS = {'pdf': build_pdf, 'docx': build_docx, 'txt': build_text}
+
+
+# ============================================================================
+# Offline stand-ins for external services
+# ============================================================================
+
+class FakeEmbeddings:
+    """Deterministic unit vectors derived from the text hash, no network"""
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+            vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSIONS)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+
+
+class MemoryDownloader:
+    """Serves documents from memory in place of Supabase Storage"""
+
+    def __init__(self, files: Dict[str, bytes]):
+        self.files = files
+
+    @contextmanager
+    def open(self, storage_path: str):
+        file_data = self.files[storage_path]
+        yield file_data, hashlib.sha256(file_data).hexdigest()
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _MemoryQuery:
+    """Accepts any PostgREST query chain; writes are kept, reads find nothing"""
+
+    def __init__(self, sink: 'MemorySupabase', table: str):
+        self.sink = sink
+        self.table = table
+        self.rows = None
+
+    def insert(self, rows, **kwargs):
+        self.rows = rows
+        return self
+
+    upsert = insert
+
+    def __getattr__(self, name):
+        # select / eq / neq / in_ / limit / order / delete / update ...
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        if self.rows is not None:
+            self.sink.written.setdefault(self.table, []).extend(
+                self.rows if isinstance(self.rows, list) else [self.rows]
+            )
+        return _Result([])
+
+
+class MemorySupabase:
+    """In-memory sink for the Supabase client (every cache lookup misses)"""
+
+    def __init__(self):
+        self.written: Dict[str, List[Dict]] = {}
+
+    def table(self, name: str) -> _MemoryQuery:
+        return _MemoryQuery(self, name)
+
+    def rpc(self, name: str, params: Dict) -> _MemoryQuery:
+        return _MemoryQuery(self, name)
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def run_once(processor: DocumentProcessor, message: Dict) -> Tuple[Dict, int]:
+    """Run one document through the pipeline; returns (profile, extracted chars)"""
+    profiler = IngestionProfiler()
+    # Keep the processor's progress logging out of the report
+    with redirect_stdout(StringIO()):
+        chunks, _ = processor._download_and_chunk(message, profiler)
+        asyncio.run(processor._insert_chunks(message, chunks, profiler))
+    return profiler.summary(), sum(len(chunk) for chunk in chunks)
+
+
+def benchmark_case(files: Dict[str, bytes], kind: str, paragraphs: int, repeat: int) -> Dict:
+    storage_path = f"bench/{kind}-{paragraphs}"
+    message = {
+        'document_id': storage_path,
+        'account_id': 'bench-account',
+        'savant_id': 'bench-savant',
+        'storage_path': storage_path,
+        'mime_type': MIME_TYPES[kind],
+    }
+
+    def new_processor() -> DocumentProcessor:
+        return DocumentProcessor(
+            supabase=MemorySupabase(),
+            embeddings=FakeEmbeddings(),
+            downloader=MemoryDownloader(files)
+        )
+
+    # Timing runs without tracemalloc, which slows allocation-heavy code
+    run_once(new_processor(), message)  # warm up imports and tokenizer
+    profiles = []
+    for _ in range(repeat):
+        gc.collect()
+        profiles.append(run_once(new_processor(), message)[0])
+
+    # Separate run for peak Python memory
+    gc.collect()
+    tracemalloc.start()
+    _, chars = run_once(new_processor(), message)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    seconds = statistics.median(profile['total_seconds'] for profile in profiles)
+    chunks = profiles[0]['chunks']
+    stages = {
+        stage: round(statistics.median(profile['stages'].get(stage, 0.0) for profile in profiles), 4)
+        for stage in profiles[0]['stages']
+    }
+    return {
+        'file_bytes': len(files[storage_path]),
+        'chars': chars,
+        'chunks': chunks,
+        'seconds': round(seconds, 4),
+        'chars_per_second': round(chars / seconds) if seconds else 0,
+        'chunks_per_second': round(chunks / seconds, 1) if seconds else 0.0,
+        'stages': stages,
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Regressions beyond `threshold` in wall time or peak memory"""
+    regressions = []
+    for case, result in results.items():
+        base = baseline.get(case)
+        if not base:
+            continue
+        for field in ('seconds', 'peak_memory_bytes'):
+            if field == 'seconds' and base[field] < MIN_COMPARABLE_SECONDS:
+                continue
+            if base[field] and result[field] > base[field] * (1 + threshold):
+                regressions.append(
+                    f"{case}: {field} {result[field]} vs baseline {base[field]} "
+                    f"(+{result[field] / base[field] - 1:.0%})"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline document ingestion benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="paragraphs per synthetic document")
+    parser.add_argument("--kinds", nargs="+", choices=sorted(BUILDERS), default=["txt", "docx", "pdf"])
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per document (median is reported)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="baseline JSON to compare against (default: benchmarks/ingestion_baseline.json)")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown / memory growth vs the baseline (default 0.2 = 20%%)")
+    parser.add_argument("--save-baseline", help="write results to this JSON file instead of comparing")
+    args = parser.parse_args()
+
+    files = {}
+    for paragraphs in args.sizes:
+        text = synthetic_paragraphs(paragraphs)
+        for kind in args.kinds:
+            files[f"bench/{kind}-{paragraphs}"] = BUILDERS[kind](text)
+
+    results = {}
+    print(f"{'case':<12} {'bytes':>10} {'chars':>9} {'chunks':>7} {'secs':>8} "
+          f"{'chars/s':>10} {'chunks/s':>9} {'peak MiB':>9}  stages (s)")
+    for paragraphs in args.sizes:
+        for kind in args.kinds:
+            case = f"{kind}-{paragraphs}"
+            result = benchmark_case(files, kind, paragraphs, args.repeat)
+            results[case] = result
+            stages = " ".join(f"{stage}={seconds}" for stage, seconds in result['stages'].items())
+            print(f"{case:<12} {result['file_bytes']:>10} {result['chars']:>9} {result['chunks']:>7} "
+                  f"{result['seconds']:>8.3f} {result['chars_per_second']:>10} {result['chunks_per_second']:>9} "
+                  f"{result['peak_memory_bytes'] / 2 ** 20:>9.1f}  {stages}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.save_baseline}")
+        return 0
+
+    # A missing baseline fails the run, so the check cannot pass by accident
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; record one with --save-baseline")
+        return 2
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nREGRESSIONS (threshold {args.threshold:.0%}):")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
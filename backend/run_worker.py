@@ -2,6 +2,10 @@
 Queue Worker Runner
 
 Run this to start the document processing queue worker.
+
+    python run_worker.py                             # single worker process
+    python run_worker.py --supervisor                # one worker per CPU
+    python run_worker.py --supervisor --processes 4  # or WORKER_PROCESSES=4
 """
 
 import sys
@@ -11,21 +15,37 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 if __name__ == "__main__":
+    import argparse
     from dotenv import load_dotenv
 
     # Load environment variables
     load_dotenv()
 
+    parser = argparse.ArgumentParser(description="Savant document processing queue worker")
+    parser.add_argument("--supervisor", action="store_true",
+                        help="run several worker processes and restart them if they crash")
+    parser.add_argument("--processes", type=int,
+                        default=int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 1)),
+                        help="worker processes in supervisor mode (default: WORKER_PROCESSES or CPU count)")
+    args = parser.parse_args()
+
     print("=" * 50)
     print("Savant Document Processing Queue Worker")
     print("=" * 50)
     print(f"Supabase URL: {os.getenv('SUPABASE_URL')}")
     print(f"OpenAI API Key: {'✓ Set' if os.getenv('OPENAI_API_KEY') else '✗ Not Set'}")
+    if args.supervisor:
+        print(f"Worker processes: {args.processes}")
     print("=" * 50)
     print()
 
-    # Now import and run the worker
-    from app.workers.queue_worker import process_queue
-    import asyncio
+    if args.supervisor:
+        from app.workers.supervisor import WorkerSupervisor
+
+        WorkerSupervisor(args.processes).run()
+    else:
+        # Now import and run the worker
+        from app.workers.queue_worker import process_queue
+        import asyncio
 
-    asyncio.run(process_queue())
+        asyncio.run(process_queue())
@@ -0,0 +1,35 @@
+-- ============================================================================
+-- Migration: 014_embedding_cache.sql
+-- Description: Content-addressed embedding cache for document ingestion
+-- ============================================================================
+
+-- ============================================================================
+-- TABLE: embedding_cache
+-- Description: Embeddings keyed by sha256(model + chunk text)
+-- ============================================================================
+-- Cloned savants and re-uploaded documents produce chunks whose text is
+-- byte-identical to chunks that were already embedded. The document worker
+-- looks chunks up here before calling OpenAI and only embeds cache misses.
+CREATE TABLE IF NOT EXISTS public.embedding_cache (
+    content_hash TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    embedding vector(1536) NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+
+COMMENT ON TABLE public.embedding_cache IS 'Chunk embeddings keyed by sha256(model, content); written by the document worker';
+
+-- Only the service role (document worker) reads and writes the cache
+ALTER TABLE public.embedding_cache ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================================
+-- documents.processing_stats
+-- Description: Per-job ingestion statistics (embedding cache hit rate, ...)
+-- ============================================================================
+ALTER TABLE public.documents
+    ADD COLUMN IF NOT EXISTS processing_stats JSONB DEFAULT '{}'::jsonb;
+
+-- ============================================================================
+-- Verification:
+-- ============================================================================
+-- SELECT processing_stats->'embedding_cache' FROM documents ORDER BY created_at DESC LIMIT 10;
@@ -0,0 +1,80 @@
+-- ============================================================================
+-- Migration: 015_document_dedup.sql
+-- Description: File-level deduplication for document ingestion
+-- ============================================================================
+
+-- ============================================================================
+-- documents.content_hash / documents.ingest_config
+-- Description: sha256 of the uploaded file and the chunking/embedding settings
+--              it was processed with
+-- ============================================================================
+ALTER TABLE public.documents
+    ADD COLUMN IF NOT EXISTS content_hash TEXT,
+    ADD COLUMN IF NOT EXISTS ingest_config TEXT;
+
+COMMENT ON COLUMN public.documents.content_hash IS 'sha256 of the uploaded file, set by the document worker';
+COMMENT ON COLUMN public.documents.ingest_config IS 'Chunking/embedding settings fingerprint the chunks were produced with';
+
+-- Lookup of a completed document with identical content and settings
+CREATE INDEX IF NOT EXISTS idx_documents_content_hash
+ON public.documents (content_hash, ingest_config)
+WHERE status = 'completed';
+
+-- Lookup of a completed document sharing the same storage object (cloned savants)
+CREATE INDEX IF NOT EXISTS idx_documents_file_path
+ON public.documents (file_path)
+WHERE status = 'completed';
+
+-- ============================================================================
+-- FUNCTION: copy_document_chunks
+-- Description: Copy all chunks of an already-processed document to another
+--              document server-side instead of re-processing the file
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.copy_document_chunks(
+  p_source_document_id uuid,
+  p_target_document_id uuid,
+  p_target_savant_id uuid,
+  p_target_account_id uuid
+)
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path TO 'public'
+AS $function$
+DECLARE
+  v_copied INTEGER;
+BEGIN
+  -- Drop leftovers from a previous failed attempt so retries stay idempotent
+  DELETE FROM document_chunks WHERE document_id = p_target_document_id;
+
+  INSERT INTO document_chunks (
+    document_id,
+    savant_id,
+    account_id,
+    chunk_index,
+    content,
+    embedding,
+    metadata,
+    token_count
+  )
+  SELECT
+    p_target_document_id,
+    p_target_savant_id,
+    p_target_account_id,
+    chunk_index,
+    content,
+    embedding,
+    metadata,
+    token_count
+  FROM document_chunks
+  WHERE document_id = p_source_document_id
+  ORDER BY chunk_index;
+
+  GET DIAGNOSTICS v_copied = ROW_COUNT;
+  RETURN v_copied;
+END;
+$function$;
+
+-- Called by the document worker only
+REVOKE EXECUTE ON FUNCTION public.copy_document_chunks FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.copy_document_chunks TO service_role;
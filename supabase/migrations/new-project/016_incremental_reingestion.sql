@@ -0,0 +1,166 @@
+-- ============================================================================
+-- Migration: 016_incremental_reingestion.sql
+-- Description: Re-ingest replaced documents by re-embedding only changed chunks
+-- ============================================================================
+
+-- ============================================================================
+-- document_chunks.content_hash
+-- Description: sha256 of the chunk text, used to diff a replaced document
+--              against its existing chunks
+-- ============================================================================
+ALTER TABLE public.document_chunks
+    ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- ============================================================================
+-- FUNCTION: apply_document_chunk_diff
+-- Description: Delete removed chunks, renumber moved chunks and insert the
+--              new (already embedded) chunks of a document in a single
+--              transaction. p_new_chunks is a JSON array of rows in the
+--              PostgREST insert format; the direct-connection writer passes
+--              NULL and COPYs them in the same transaction instead.
+-- ============================================================================
+DROP FUNCTION IF EXISTS public.apply_document_chunk_diff(uuid, uuid[], uuid[], integer[]);
+
+CREATE OR REPLACE FUNCTION public.apply_document_chunk_diff(
+  p_document_id uuid,
+  p_delete_ids uuid[],
+  p_renumber_ids uuid[],
+  p_renumber_indexes integer[],
+  p_new_chunks jsonb DEFAULT NULL
+)
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path TO 'public'
+AS $function$
+BEGIN
+  DELETE FROM document_chunks
+  WHERE document_id = p_document_id
+    AND id = ANY(p_delete_ids);
+
+  UPDATE document_chunks dc
+  SET chunk_index = r.chunk_index
+  FROM unnest(p_renumber_ids, p_renumber_indexes) AS r(id, chunk_index)
+  WHERE dc.id = r.id
+    AND dc.document_id = p_document_id;
+
+  INSERT INTO document_chunks (
+    id,
+    document_id,
+    savant_id,
+    account_id,
+    chunk_index,
+    content,
+    content_hash,
+    embedding,
+    token_count
+  )
+  SELECT
+    r.id,
+    r.document_id,
+    r.savant_id,
+    r.account_id,
+    r.chunk_index,
+    r.content,
+    r.content_hash,
+    r.embedding,
+    r.token_count
+  FROM jsonb_populate_recordset(NULL::document_chunks, COALESCE(p_new_chunks, '[]'::jsonb)) AS r
+  WHERE r.document_id = p_document_id;
+END;
+$function$;
+
+-- ============================================================================
+-- FUNCTION: queue_document_update_admin
+-- Description: Queue a replaced document for incremental re-ingestion
+--              (no auth check - for server actions, like
+--              queue_document_for_processing_admin)
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.queue_document_update_admin(
+  p_document_id uuid,
+  p_account_id uuid,
+  p_savant_id uuid,
+  p_storage_path text,
+  p_mime_type text
+)
+RETURNS bigint
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $function$
+DECLARE
+  msg_id BIGINT;
+BEGIN
+  -- No auth check - caller (server action) is responsible for authorization
+
+  SELECT pgmq.send(
+    'document_processing',
+    jsonb_build_object(
+      'document_id', p_document_id,
+      'account_id', p_account_id,
+      'savant_id', p_savant_id,
+      'storage_path', p_storage_path,
+      'mime_type', p_mime_type,
+      'mode', 'update'
+    )
+  ) INTO msg_id;
+
+  RETURN msg_id;
+END;
+$function$;
+
+-- ============================================================================
+-- FUNCTION: copy_document_chunks
+-- Description: Carry content_hash along when copying chunks of a duplicate file
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.copy_document_chunks(
+  p_source_document_id uuid,
+  p_target_document_id uuid,
+  p_target_savant_id uuid,
+  p_target_account_id uuid
+)
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path TO 'public'
+AS $function$
+DECLARE
+  v_copied INTEGER;
+BEGIN
+  -- Drop leftovers from a previous failed attempt so retries stay idempotent
+  DELETE FROM document_chunks WHERE document_id = p_target_document_id;
+
+  INSERT INTO document_chunks (
+    document_id,
+    savant_id,
+    account_id,
+    chunk_index,
+    content,
+    content_hash,
+    embedding,
+    metadata,
+    token_count
+  )
+  SELECT
+    p_target_document_id,
+    p_target_savant_id,
+    p_target_account_id,
+    chunk_index,
+    content,
+    content_hash,
+    embedding,
+    metadata,
+    token_count
+  FROM document_chunks
+  WHERE document_id = p_source_document_id
+  ORDER BY chunk_index;
+
+  GET DIAGNOSTICS v_copied = ROW_COUNT;
+  RETURN v_copied;
+END;
+$function$;
+
+-- Worker-only functions
+REVOKE EXECUTE ON FUNCTION public.apply_document_chunk_diff FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.apply_document_chunk_diff TO service_role;
+REVOKE EXECUTE ON FUNCTION public.queue_document_update_admin FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.queue_document_update_admin TO service_role;
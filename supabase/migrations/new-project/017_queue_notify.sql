@@ -0,0 +1,41 @@
+-- ============================================================================
+-- Migration: 017_queue_notify.sql
+-- Description: NOTIFY document workers when a document is queued
+-- ============================================================================
+
+-- Workers LISTEN on the 'document_queue' channel and pick up new messages
+-- immediately instead of polling pgmq_read every few seconds. The payload is
+-- the queue name. Notifications are delivered when the sending transaction
+-- commits, so a worker never wakes before the message is readable.
+
+-- ============================================================================
+-- FUNCTION: notify_document_queue
+-- Description: Trigger function that NOTIFYs on inserts into a pgmq queue table
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.notify_document_queue()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $function$
+BEGIN
+  -- pgmq stores queue 'x' in table pgmq.q_x
+  PERFORM pg_notify('document_queue', substring(TG_TABLE_NAME FROM 3));
+  RETURN NULL;
+END;
+$function$;
+
+-- ============================================================================
+-- TRIGGER: notify on document_processing inserts
+-- ============================================================================
+-- Statement-level, so batched sends produce a single notification
+DROP TRIGGER IF EXISTS notify_document_processing ON pgmq.q_document_processing;
+CREATE TRIGGER notify_document_processing
+AFTER INSERT ON pgmq.q_document_processing
+FOR EACH STATEMENT
+EXECUTE FUNCTION public.notify_document_queue();
+
+-- ============================================================================
+-- Verification:
+-- ============================================================================
+-- In one session:   LISTEN document_queue;
+-- In another:       SELECT pgmq_send('document_processing', '{"test": "message"}'::jsonb);
+-- The first session receives: Asynchronous notification "document_queue" with payload "document_processing"
@@ -0,0 +1,44 @@
+-- ============================================================================
+-- Migration: 018_job_heartbeat_checkpoints.sql
+-- Description: Visibility-timeout heartbeat and stage checkpoints for long
+--              document processing jobs
+-- ============================================================================
+
+-- ============================================================================
+-- FUNCTION: pgmq_set_vt
+-- Description: Wrapper to extend the visibility timeout of a message that is
+--              still being processed
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.pgmq_set_vt(queue_name text, msg_id bigint, vt integer)
+RETURNS SETOF pgmq.message_record
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $function$
+BEGIN
+    RETURN QUERY SELECT * FROM pgmq.set_vt(queue_name, msg_id, vt);
+END;
+$function$;
+
+-- ============================================================================
+-- TABLE: document_checkpoints
+-- Description: Stage outputs of an in-progress document job. A retried job
+--              resumes from here instead of re-downloading and re-chunking.
+--              Embeddings finished before a failure are kept in embedding_cache.
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS public.document_checkpoints (
+    document_id UUID PRIMARY KEY REFERENCES public.documents(id) ON DELETE CASCADE,
+    storage_path TEXT NOT NULL,
+    ingest_config TEXT NOT NULL,
+    content_hash TEXT,
+    stage TEXT NOT NULL CHECK (stage = ANY (ARRAY['chunked'::text])),
+    chunks JSONB NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+COMMENT ON TABLE public.document_checkpoints IS 'Resumable stage outputs for document processing jobs; deleted when a job completes or is dead-lettered';
+
+-- Only the service role (document worker) reads and writes checkpoints
+ALTER TABLE public.document_checkpoints ENABLE ROW LEVEL SECURITY;
+
+REVOKE EXECUTE ON FUNCTION public.pgmq_set_vt FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.pgmq_set_vt TO service_role;
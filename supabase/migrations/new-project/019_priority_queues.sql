@@ -0,0 +1,170 @@
+-- ============================================================================
+-- Migration: 019_priority_queues.sql
+-- Description: Size-aware routing of documents into a fast-lane queue
+-- ============================================================================
+
+-- Small documents go to 'document_processing_fast', everything else stays on
+-- 'document_processing'. Workers reserve part of their capacity for the fast
+-- lane, so a one-page FAQ no longer waits behind a 400-page manual.
+
+-- ============================================================================
+-- CREATE FAST-LANE QUEUE
+-- ============================================================================
+SELECT pgmq.create('document_processing_fast');
+
+GRANT ALL ON ALL TABLES IN SCHEMA pgmq TO postgres, anon, authenticated, service_role;
+GRANT ALL ON ALL SEQUENCES IN SCHEMA pgmq TO postgres, anon, authenticated, service_role;
+
+-- Wake listening workers on fast-lane inserts too (see 017_queue_notify.sql)
+DROP TRIGGER IF EXISTS notify_document_processing_fast ON pgmq.q_document_processing_fast;
+CREATE TRIGGER notify_document_processing_fast
+AFTER INSERT ON pgmq.q_document_processing_fast
+FOR EACH STATEMENT
+EXECUTE FUNCTION public.notify_document_queue();
+
+-- ============================================================================
+-- FUNCTION: document_queue_for
+-- Description: Pick the processing queue for a document from its size and type
+-- ============================================================================
+-- Plain text carries far more text per byte than PDF/DOCX, so it gets a lower
+-- size limit. Unknown sizes go to the regular queue.
+CREATE OR REPLACE FUNCTION public.document_queue_for(p_file_size bigint, p_mime_type text)
+RETURNS text
+LANGUAGE sql
+IMMUTABLE
+AS $function$
+  SELECT CASE
+    WHEN p_file_size IS NULL THEN 'document_processing'
+    WHEN p_mime_type LIKE 'text/%' AND p_file_size <= 256 * 1024 THEN 'document_processing_fast'
+    WHEN p_mime_type NOT LIKE 'text/%' AND p_file_size <= 2 * 1024 * 1024 THEN 'document_processing_fast'
+    ELSE 'document_processing'
+  END;
+$function$;
+
+-- ============================================================================
+-- FUNCTION: queue_document_for_processing
+-- Description: Queue documents for background processing (with auth check),
+--              routed by size and type
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.queue_document_for_processing(
+  p_document_id uuid,
+  p_account_id uuid,
+  p_savant_id uuid,
+  p_storage_path text,
+  p_mime_type text
+)
+RETURNS bigint
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path TO 'public', 'pgmq'
+AS $function$
+DECLARE
+  msg_id BIGINT;
+  v_file_size BIGINT;
+BEGIN
+  -- Only allow queueing if user has access to this account
+  IF NOT EXISTS (
+    SELECT 1 FROM public.account_members
+    WHERE account_id = p_account_id
+    AND user_id = auth.uid()
+  ) THEN
+    RAISE EXCEPTION 'Access denied';
+  END IF;
+
+  SELECT file_size INTO v_file_size FROM public.documents WHERE id = p_document_id;
+
+  -- Send message to the queue for this document's size
+  SELECT pgmq.send(
+    public.document_queue_for(v_file_size, p_mime_type),
+    jsonb_build_object(
+      'document_id', p_document_id,
+      'account_id', p_account_id,
+      'savant_id', p_savant_id,
+      'storage_path', p_storage_path,
+      'mime_type', p_mime_type
+    )
+  ) INTO msg_id;
+
+  RETURN msg_id;
+END;
+$function$;
+
+-- ============================================================================
+-- FUNCTION: queue_document_for_processing_admin
+-- Description: Queue documents for processing without auth check (for server
+--              actions), routed by size and type
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.queue_document_for_processing_admin(
+  p_document_id uuid,
+  p_account_id uuid,
+  p_savant_id uuid,
+  p_storage_path text,
+  p_mime_type text
+)
+RETURNS bigint
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $function$
+DECLARE
+  msg_id BIGINT;
+  v_file_size BIGINT;
+BEGIN
+  -- No auth check - caller (server action) is responsible for authorization
+  -- Server action verifies user is member of account before calling this
+
+  SELECT file_size INTO v_file_size FROM public.documents WHERE id = p_document_id;
+
+  SELECT pgmq.send(
+    public.document_queue_for(v_file_size, p_mime_type),
+    jsonb_build_object(
+      'document_id', p_document_id,
+      'account_id', p_account_id,
+      'savant_id', p_savant_id,
+      'storage_path', p_storage_path,
+      'mime_type', p_mime_type
+    )
+  ) INTO msg_id;
+
+  RETURN msg_id;
+END;
+$function$;
+
+-- ============================================================================
+-- FUNCTION: queue_document_update_admin
+-- Description: Queue a replaced document for incremental re-ingestion,
+--              routed by size and type
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.queue_document_update_admin(
+  p_document_id uuid,
+  p_account_id uuid,
+  p_savant_id uuid,
+  p_storage_path text,
+  p_mime_type text
+)
+RETURNS bigint
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $function$
+DECLARE
+  msg_id BIGINT;
+  v_file_size BIGINT;
+BEGIN
+  -- No auth check - caller (server action) is responsible for authorization
+
+  SELECT file_size INTO v_file_size FROM public.documents WHERE id = p_document_id;
+
+  SELECT pgmq.send(
+    public.document_queue_for(v_file_size, p_mime_type),
+    jsonb_build_object(
+      'document_id', p_document_id,
+      'account_id', p_account_id,
+      'savant_id', p_savant_id,
+      'storage_path', p_storage_path,
+      'mime_type', p_mime_type,
+      'mode', 'update'
+    )
+  ) INTO msg_id;
+
+  RETURN msg_id;
+END;
+$function$;
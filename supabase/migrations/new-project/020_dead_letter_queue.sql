@@ -0,0 +1,79 @@
+-- ============================================================================
+-- Migration: 020_dead_letter_queue.sql
+-- Description: Dead-letter queue for document jobs that keep failing
+-- ============================================================================
+
+-- Workers retry a failing message with exponential visibility backoff and,
+-- once its pgmq read count reaches the retry limit, move it to
+-- 'document_processing_dlq' instead of retrying it forever.
+
+-- ============================================================================
+-- CREATE DEAD-LETTER QUEUE
+-- ============================================================================
+-- No NOTIFY trigger: nothing consumes this queue automatically
+SELECT pgmq.create('document_processing_dlq');
+
+GRANT ALL ON ALL TABLES IN SCHEMA pgmq TO postgres, anon, authenticated, service_role;
+GRANT ALL ON ALL SEQUENCES IN SCHEMA pgmq TO postgres, anon, authenticated, service_role;
+
+-- ============================================================================
+-- FUNCTION: pgmq_dead_letter
+-- Description: Atomically move a message to a dead-letter queue, wrapping it
+--              with its source queue, read count and last error
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.pgmq_dead_letter(
+  queue_name text,
+  msg_id bigint,
+  dlq_name text,
+  error text
+)
+RETURNS bigint
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $function$
+DECLARE
+  v_message JSONB;
+  v_read_ct INTEGER;
+  v_dlq_msg_id BIGINT;
+BEGIN
+  -- pgmq stores queue 'x' in table pgmq.q_x
+  EXECUTE format('SELECT message, read_ct FROM pgmq.%I WHERE msg_id = $1 FOR UPDATE', 'q_' || queue_name)
+  INTO v_message, v_read_ct
+  USING msg_id;
+
+  IF v_message IS NULL THEN
+    RETURN NULL;  -- already deleted or dead-lettered
+  END IF;
+
+  SELECT pgmq.send(
+    dlq_name,
+    jsonb_build_object(
+      'message', v_message,
+      'source_queue', queue_name,
+      'source_msg_id', msg_id,
+      'read_ct', v_read_ct,
+      'error', error,
+      'failed_at', now()
+    )
+  ) INTO v_dlq_msg_id;
+
+  PERFORM pgmq.delete(queue_name, msg_id);
+
+  RETURN v_dlq_msg_id;
+END;
+$function$;
+
+REVOKE EXECUTE ON FUNCTION public.pgmq_dead_letter FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.pgmq_dead_letter TO service_role;
+
+-- ============================================================================
+-- INSPECTING AND REPLAYING DEAD LETTERS
+-- ============================================================================
+-- List dead-lettered jobs:
+-- SELECT msg_id, message->>'error', message->'message'->>'document_id'
+-- FROM pgmq.q_document_processing_dlq ORDER BY msg_id DESC;
+
+-- Replay one after fixing the cause (replace 123):
+-- SELECT pgmq.send(message->>'source_queue', message->'message')
+-- FROM pgmq.q_document_processing_dlq WHERE msg_id = 123;
+-- SELECT pgmq.delete('document_processing_dlq', 123);
@@ -0,0 +1,22 @@
+-- ============================================================================
+-- Migration: 021_queue_metrics.sql
+-- Description: Expose pgmq queue metrics to the document worker
+-- ============================================================================
+
+-- ============================================================================
+-- FUNCTION: pgmq_metrics
+-- Description: Wrapper to read queue length and message ages, exported by the
+--              worker as Prometheus metrics
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.pgmq_metrics(queue_name text)
+RETURNS SETOF pgmq.metrics_result
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $function$
+BEGIN
+    RETURN QUERY SELECT * FROM pgmq.metrics(queue_name);
+END;
+$function$;
+
+REVOKE EXECUTE ON FUNCTION public.pgmq_metrics FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.pgmq_metrics TO service_role;
@@ -0,0 +1,453 @@
+-- ============================================================================
+-- Migration: 022_near_duplicate_chunks.sql
+-- Description: Store near-duplicate chunks as references instead of new
+--              embedded rows
+-- ============================================================================
+
+-- The document worker computes a MinHash signature per chunk and LSH band
+-- hashes over it (app/services/near_duplicates.py). A new chunk whose
+-- signature is close enough to an existing chunk of the same savant is stored
+-- as a reference: its content is kept, but it has no embedding and points at
+-- the canonical chunk through duplicate_of_chunk_id. Only canonical chunks are
+-- embedded and indexed, so the vector index grows with unique content.
+
+-- ============================================================================
+-- document_chunks: signature, LSH bands and reference
+-- ============================================================================
+ALTER TABLE public.document_chunks
+    ADD COLUMN IF NOT EXISTS minhash BYTEA,
+    ADD COLUMN IF NOT EXISTS lsh_bands BIGINT[],
+    ADD COLUMN IF NOT EXISTS duplicate_of_chunk_id UUID;
+
+COMMENT ON COLUMN public.document_chunks.minhash IS 'MinHash signature of the chunk text (canonical chunks only)';
+COMMENT ON COLUMN public.document_chunks.lsh_bands IS 'LSH band hashes of minhash, the per-savant near-duplicate index (canonical chunks only)';
+COMMENT ON COLUMN public.document_chunks.duplicate_of_chunk_id IS 'Canonical chunk this near-duplicate refers to; NULL embedding when set';
+
+-- Candidate lookup: canonical chunks sharing an LSH band
+CREATE INDEX IF NOT EXISTS idx_document_chunks_lsh_bands
+ON public.document_chunks USING gin (lsh_bands)
+WHERE lsh_bands IS NOT NULL;
+
+-- References of a canonical chunk (promotion on delete, visibility in match_chunks)
+CREATE INDEX IF NOT EXISTS idx_document_chunks_duplicate_of
+ON public.document_chunks (duplicate_of_chunk_id)
+WHERE duplicate_of_chunk_id IS NOT NULL;
+
+-- ============================================================================
+-- FUNCTION: find_near_duplicate_chunks
+-- Description: Canonical chunks of a savant sharing at least one LSH band,
+--              from documents with the same visibility as the new document
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.find_near_duplicate_chunks(
+  p_savant_id uuid,
+  p_document_id uuid,
+  p_lsh_bands bigint[],
+  p_include_document boolean DEFAULT false
+)
+RETURNS TABLE(
+  id uuid,
+  minhash bytea,
+  lsh_bands bigint[]
+)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path TO 'public'
+AS $function$
+  SELECT dc.id, dc.minhash, dc.lsh_bands
+  FROM document_chunks dc
+  JOIN documents d ON d.id = dc.document_id
+  JOIN documents nd ON nd.id = p_document_id
+  WHERE dc.savant_id = p_savant_id
+    AND dc.lsh_bands && p_lsh_bands
+    AND dc.duplicate_of_chunk_id IS NULL
+    AND dc.embedding IS NOT NULL
+    -- Never let a visible chunk refer to content of a hidden document
+    AND d.is_visible_to_user IS NOT DISTINCT FROM nd.is_visible_to_user
+    -- A full (re)ingest replaces the document's own rows, so they are not candidates
+    AND (p_include_document OR dc.document_id <> p_document_id);
+$function$;
+
+-- ============================================================================
+-- TRIGGER: promote_near_duplicate_references
+-- Description: When canonical chunks are deleted, the oldest surviving
+--              reference inherits the embedding and becomes canonical, and
+--              the remaining references are repointed to it
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.promote_near_duplicate_references()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path TO 'public'
+AS $function$
+BEGIN
+  WITH heirs AS (
+    SELECT DISTINCT ON (r.duplicate_of_chunk_id)
+      r.id AS heir_id,
+      gone.id AS old_id,
+      gone.embedding,
+      gone.minhash,
+      gone.lsh_bands
+    FROM document_chunks r
+    JOIN deleted_chunks gone ON gone.id = r.duplicate_of_chunk_id
+    ORDER BY r.duplicate_of_chunk_id, r.created_at, r.id
+  ),
+  promoted AS (
+    UPDATE document_chunks dc
+    SET embedding = h.embedding,
+        minhash = h.minhash,
+        lsh_bands = h.lsh_bands,
+        duplicate_of_chunk_id = NULL
+    FROM heirs h
+    WHERE dc.id = h.heir_id
+    RETURNING dc.id AS heir_id, h.old_id
+  )
+  UPDATE document_chunks dc
+  SET duplicate_of_chunk_id = p.heir_id
+  FROM promoted p
+  WHERE dc.duplicate_of_chunk_id = p.old_id
+    AND dc.id <> p.heir_id;
+
+  RETURN NULL;
+END;
+$function$;
+
+-- Statement-level, after the delete: row-level BEFORE triggers would modify
+-- rows the same DELETE may still remove (e.g. a whole document)
+DROP TRIGGER IF EXISTS promote_near_duplicate_references ON public.document_chunks;
+CREATE TRIGGER promote_near_duplicate_references
+AFTER DELETE ON public.document_chunks
+REFERENCING OLD TABLE AS deleted_chunks
+FOR EACH STATEMENT
+EXECUTE FUNCTION public.promote_near_duplicate_references();
+
+-- ============================================================================
+-- FUNCTION: apply_document_chunk_diff
+-- Description: Incremental re-ingest (016), now also inserting the
+--              near-duplicate columns of the new chunks
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.apply_document_chunk_diff(
+  p_document_id uuid,
+  p_delete_ids uuid[],
+  p_renumber_ids uuid[],
+  p_renumber_indexes integer[],
+  p_new_chunks jsonb DEFAULT NULL
+)
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path TO 'public'
+AS $function$
+BEGIN
+  DELETE FROM document_chunks
+  WHERE document_id = p_document_id
+    AND id = ANY(p_delete_ids);
+
+  UPDATE document_chunks dc
+  SET chunk_index = r.chunk_index
+  FROM unnest(p_renumber_ids, p_renumber_indexes) AS r(id, chunk_index)
+  WHERE dc.id = r.id
+    AND dc.document_id = p_document_id;
+
+  INSERT INTO document_chunks (
+    id,
+    document_id,
+    savant_id,
+    account_id,
+    chunk_index,
+    content,
+    content_hash,
+    embedding,
+    token_count,
+    minhash,
+    lsh_bands,
+    duplicate_of_chunk_id
+  )
+  SELECT
+    r.id,
+    r.document_id,
+    r.savant_id,
+    r.account_id,
+    r.chunk_index,
+    r.content,
+    r.content_hash,
+    r.embedding,
+    r.token_count,
+    r.minhash,
+    r.lsh_bands,
+    r.duplicate_of_chunk_id
+  FROM jsonb_populate_recordset(NULL::document_chunks, COALESCE(p_new_chunks, '[]'::jsonb)) AS r
+  WHERE r.document_id = p_document_id;
+END;
+$function$;
+
+-- ============================================================================
+-- FUNCTION: match_chunks
+-- Description: Vector search over canonical chunks of visible documents. A
+--              canonical chunk of a hidden document is found through its
+--              references instead: the oldest reference in a visible
+--              document is returned (its own content and document), never
+--              the hidden chunk's text.
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.match_chunks(
+  query_embedding vector,
+  p_savant_id uuid,
+  match_threshold double precision DEFAULT 0.7,
+  match_count integer DEFAULT 5
+)
+RETURNS TABLE(
+  id uuid,
+  content text,
+  document_id uuid,
+  similarity double precision,
+  metadata jsonb
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $function$
+BEGIN
+  RETURN QUERY
+  SELECT
+    COALESCE(vr.id, dc.id),
+    COALESCE(vr.content, dc.content),
+    COALESCE(vr.document_id, dc.document_id),
+    1 - (dc.embedding <=> query_embedding) AS similarity,
+    COALESCE(vr.metadata, dc.metadata)
+  FROM public.document_chunks dc
+  JOIN public.documents d ON d.id = dc.document_id
+  -- Visibility of a document can change after its chunks were deduplicated:
+  -- a hidden canonical chunk stands in for its visible references
+  LEFT JOIN LATERAL (
+    SELECT r.id, r.content, r.document_id, r.metadata
+    FROM public.document_chunks r
+    JOIN public.documents rd ON rd.id = r.document_id
+    WHERE d.is_visible_to_user IS NOT TRUE
+      AND r.duplicate_of_chunk_id = dc.id
+      AND rd.is_visible_to_user = true
+    ORDER BY r.created_at, r.id
+    LIMIT 1
+  ) vr ON true
+  WHERE dc.savant_id = p_savant_id
+    AND (d.is_visible_to_user = true OR vr.id IS NOT NULL)
+    AND 1 - (dc.embedding <=> query_embedding) > match_threshold
+  ORDER BY dc.embedding <=> query_embedding
+  LIMIT match_count;
+END;
+$function$;
+
+-- ============================================================================
+-- FUNCTION: copy_document_chunks
+-- Description: Copy chunks of an identical, already-processed document.
+--              Within the same savant the copies are references to the source
+--              chunks; other savants get embedded rows (references resolved).
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.copy_document_chunks(
+  p_source_document_id uuid,
+  p_target_document_id uuid,
+  p_target_savant_id uuid,
+  p_target_account_id uuid
+)
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path TO 'public'
+AS $function$
+DECLARE
+  v_copied INTEGER;
+  v_same_savant BOOLEAN;
+BEGIN
+  -- Drop leftovers from a previous failed attempt so retries stay idempotent
+  DELETE FROM document_chunks WHERE document_id = p_target_document_id;
+
+  SELECT savant_id = p_target_savant_id INTO v_same_savant
+  FROM documents WHERE id = p_source_document_id;
+
+  INSERT INTO document_chunks (
+    document_id,
+    savant_id,
+    account_id,
+    chunk_index,
+    content,
+    content_hash,
+    embedding,
+    minhash,
+    lsh_bands,
+    duplicate_of_chunk_id,
+    metadata,
+    token_count
+  )
+  SELECT
+    p_target_document_id,
+    p_target_savant_id,
+    p_target_account_id,
+    dc.chunk_index,
+    dc.content,
+    dc.content_hash,
+    CASE WHEN v_same_savant THEN NULL ELSE COALESCE(dc.embedding, canonical.embedding) END,
+    CASE WHEN v_same_savant THEN NULL ELSE COALESCE(dc.minhash, canonical.minhash) END,
+    CASE WHEN v_same_savant THEN NULL ELSE COALESCE(dc.lsh_bands, canonical.lsh_bands) END,
+    CASE WHEN v_same_savant THEN COALESCE(dc.duplicate_of_chunk_id, dc.id) ELSE NULL END,
+    dc.metadata,
+    dc.token_count
+  FROM document_chunks dc
+  LEFT JOIN document_chunks canonical ON canonical.id = dc.duplicate_of_chunk_id
+  WHERE dc.document_id = p_source_document_id
+  ORDER BY dc.chunk_index;
+
+  GET DIAGNOSTICS v_copied = ROW_COUNT;
+  RETURN v_copied;
+END;
+$function$;
+
+-- ============================================================================
+-- FUNCTION: clone_savant_from_store
+-- Description: Clone a public savant from the marketplace (003_functions.sql),
+--              now resolving near-duplicate references: the clone is another
+--              savant, so every chunk is copied as an embedded canonical row
+--              (as copy_document_chunks does across savants)
+-- ============================================================================
+CREATE OR REPLACE FUNCTION public.clone_savant_from_store(
+  p_source_savant_id uuid,
+  p_target_account_id uuid,
+  p_target_user_id uuid,
+  p_new_name text DEFAULT NULL::text
+)
+RETURNS uuid
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $function$
+DECLARE
+  v_new_savant_id UUID;
+  v_source_savant RECORD;
+  v_doc RECORD;
+  v_new_doc_id UUID;
+  v_listing_id UUID;
+BEGIN
+  -- Get source savant
+  SELECT * INTO v_source_savant FROM savants WHERE id = p_source_savant_id AND is_public = true;
+
+  IF v_source_savant IS NULL THEN
+    RAISE EXCEPTION 'Source savant not found or not public';
+  END IF;
+
+  -- Create new savant (clone)
+  INSERT INTO savants (
+    account_id,
+    name,
+    slug,
+    description,
+    system_prompt,
+    model_config,
+    rag_config,
+    is_public,
+    is_active,
+    cloned_from_id,
+    original_creator_account_id
+  ) VALUES (
+    p_target_account_id,
+    COALESCE(p_new_name, v_source_savant.name || ' (Imported)'),
+    v_source_savant.slug || '-' || substring(gen_random_uuid()::text, 1, 8),
+    v_source_savant.description,
+    v_source_savant.system_prompt,
+    v_source_savant.model_config,
+    v_source_savant.rag_config,
+    false,  -- Cloned savants start as private
+    true,   -- is_active
+    p_source_savant_id,
+    v_source_savant.account_id
+  ) RETURNING id INTO v_new_savant_id;
+
+  -- Clone all documents and their chunks
+  FOR v_doc IN
+    SELECT * FROM documents WHERE savant_id = p_source_savant_id
+  LOOP
+    -- Create new document
+    INSERT INTO documents (
+      savant_id,
+      account_id,
+      name,
+      file_path,
+      file_type,
+      file_size,
+      status,
+      metadata,
+      chunk_count
+    ) VALUES (
+      v_new_savant_id,
+      p_target_account_id,
+      v_doc.name,
+      v_doc.file_path,  -- Share storage path (same file)
+      v_doc.file_type,
+      v_doc.file_size,
+      v_doc.status,
+      v_doc.metadata,
+      v_doc.chunk_count
+    ) RETURNING id INTO v_new_doc_id;
+
+    -- Clone all chunks for this document; references take the embedding
+    -- and signature of their canonical chunk
+    INSERT INTO document_chunks (
+      document_id,
+      savant_id,
+      account_id,
+      chunk_index,
+      content,
+      content_hash,
+      embedding,
+      minhash,
+      lsh_bands,
+      duplicate_of_chunk_id,
+      metadata,
+      token_count
+    )
+    SELECT
+      v_new_doc_id,
+      v_new_savant_id,
+      p_target_account_id,
+      dc.chunk_index,
+      dc.content,
+      dc.content_hash,
+      COALESCE(canonical.embedding, dc.embedding),
+      COALESCE(canonical.minhash, dc.minhash),
+      COALESCE(canonical.lsh_bands, dc.lsh_bands),
+      NULL,
+      dc.metadata,
+      dc.token_count
+    FROM document_chunks dc
+    LEFT JOIN document_chunks canonical ON canonical.id = dc.duplicate_of_chunk_id
+    WHERE dc.document_id = v_doc.id;
+  END LOOP;
+
+  -- Record the import
+  SELECT id INTO v_listing_id FROM store_listings WHERE savant_id = p_source_savant_id;
+
+  INSERT INTO store_imports (
+    source_savant_id,
+    source_listing_id,
+    cloned_savant_id,
+    imported_by_account_id,
+    imported_by_user_id
+  ) VALUES (
+    p_source_savant_id,
+    v_listing_id,
+    v_new_savant_id,
+    p_target_account_id,
+    p_target_user_id
+  );
+
+  -- Update import count on listing
+  UPDATE store_listings
+  SET import_count = import_count + 1
+  WHERE savant_id = p_source_savant_id;
+
+  -- Update creator profile stats
+  UPDATE creator_profiles
+  SET total_imports = total_imports + 1
+  WHERE account_id = v_source_savant.account_id;
+
+  RETURN v_new_savant_id;
+END;
+$function$;
+
+REVOKE EXECUTE ON FUNCTION public.find_near_duplicate_chunks FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.find_near_duplicate_chunks TO service_role;
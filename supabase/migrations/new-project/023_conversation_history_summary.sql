@@ -0,0 +1,17 @@
+-- ============================================================================
+-- Migration: 023_conversation_history_summary.sql
+-- Description: Rolling summary of conversation turns that no longer fit the
+--              agent's history token budget
+-- ============================================================================
+
+-- Written by the backend (app/agents/history_compaction.py) after each turn:
+-- older runs are folded into the summary, which replaces them in the prompt.
+-- Kept on conversations rather than in Agno's agent_sessions row so the
+-- background update never races Agno's own session writes.
+ALTER TABLE public.conversations
+    ADD COLUMN IF NOT EXISTS history_summary TEXT,
+    ADD COLUMN IF NOT EXISTS history_summary_run_id TEXT,
+    ADD COLUMN IF NOT EXISTS history_summary_updated_at TIMESTAMPTZ;
+
+COMMENT ON COLUMN public.conversations.history_summary IS 'Rolling summary of turns older than the agent history window';
+COMMENT ON COLUMN public.conversations.history_summary_run_id IS 'Agno run id of the last turn folded into history_summary';